@@ -0,0 +1,76 @@
+"""
+calculate_stat_metrics 벤치마크: 이전 구현(DataFrame 복사 + drop_duplicates)과 현재 구현(정수 키 + pd.unique) 비교.
+합성 출석 데이터(이용자 3,000명, 수업 120개, 1년치)를 만들어 두 구현의 결과가 같은지 확인하고 시간을 잽니다.
+
+사용법 (저장소 루트에서):
+    python bench/stat_metrics.py              # 100,000 / 200,000 / 500,000 행
+    python bench/stat_metrics.py 1000000      # 원하는 행 수
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import config
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py는 import 시 st.secrets를 읽으므로, secrets.toml이 없으면 빈 설정 파일을 지정
+if not st.secrets.load_if_toml_exists():
+    path = os.path.join(tempfile.mkdtemp(), "secrets.toml")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('SHEET_URL = ""\n')
+    config.set_option("secrets.files", [path])
+
+import main  # noqa: E402
+
+REPEAT = 5
+
+def old_calculate_stat_metrics(df_target):
+    """이전 구현 (비교용 원본 그대로)"""
+    if df_target.empty:
+        return 0, 0, 0, 0
+    temp_df = df_target.copy()
+    if not pd.api.types.is_datetime64_any_dtype(temp_df['attendance_date']):
+        temp_df['attendance_date'] = pd.to_datetime(temp_df['attendance_date'])
+    cnt_real = temp_df['user_id'].nunique()
+    cnt_cumulative = len(temp_df)
+    cnt_subject_sum = temp_df[['user_id', 'class_name']].drop_duplicates().shape[0]
+    temp_df['half_year'] = temp_df['attendance_date'].dt.month.apply(lambda x: '상반기' if x <= 6 else '하반기')
+    cnt_subject_period_sum = temp_df[['user_id', 'class_name', 'half_year']].drop_duplicates().shape[0]
+    return cnt_real, cnt_cumulative, cnt_subject_sum, cnt_subject_period_sum
+
+def make_attendance(n, users=3000, classes=120, seed=0):
+    """출석 팩트 테이블과 같은 dtype의 합성 데이터 (날짜순, 날짜 결측 0.5% 포함)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2026-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 365, n)), unit="D")
+    df = pd.DataFrame({
+        "user_id": [f"U{i:05d}" for i in rng.integers(0, users, n)],
+        "class_name": [f"수업{i}" for i in rng.integers(0, classes, n)],
+        "attendance_date": dates,
+    })
+    df.loc[rng.random(n) < 0.005, "attendance_date"] = pd.NaT
+    return main.apply_schema("attendance", df)
+
+def best_of(func, df):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(df)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def run(sizes):
+    print(f"{'행 수':>10} {'이전(ms)':>10} {'현재(ms)':>10} {'배율':>6}")
+    for n in sizes:
+        df = make_attendance(n)
+        old_t, old = best_of(old_calculate_stat_metrics, df)
+        new_t, new = best_of(main.calculate_stat_metrics, df)
+        assert tuple(map(int, old)) == tuple(map(int, new)), (old, new)
+        print(f"{n:>10,} {old_t * 1000:>10.1f} {new_t * 1000:>10.1f} {old_t / new_t:>5.1f}x")
+
+if __name__ == "__main__":
+    run([int(a) for a in sys.argv[1:]] or [100_000, 200_000, 500_000])
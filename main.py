@@ -1,12 +1,21 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import gspread
 import io
 from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import os
+import calendar
+import json
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import time
+import logging
 import random
 import base64
 import streamlit.components.v1 as components 
@@ -485,10 +494,27 @@ st.markdown(f"""
 # -----------------------------------------------------------------------------
 # 2. 데이터베이스 연결
 # -----------------------------------------------------------------------------
-SHEET_URL = st.secrets["SHEET_URL"]
+SHEET_URL = st.secrets.get("SHEET_URL", "")
+# 저장소 선택: "gsheet"(기본, 구글 시트) / "sqlite"(로컬 SQLite 파일, 시트와 같은 표 구조 - 2-6 참고)
+DB_BACKEND = st.secrets.get("DB_BACKEND", "gsheet")
+LOCAL_DB_PATH = st.secrets.get("LOCAL_DB_PATH", "local_db.sqlite3")
+MIRROR_TO_SHEET = bool(st.secrets.get("MIRROR_TO_SHEET", False))  # sqlite 사용 시 시트에 보기용 사본 유지
+MIRROR_INTERVAL = int(st.secrets.get("MIRROR_INTERVAL", 300))      # 시트 사본 갱신 주기(초)
 
 @st.cache_resource
 def connect_db():
+    """설정된 저장소 연결 (로컬 DB도 시트와 같은 워크시트 메서드를 제공하므로 이후 코드는 동일)"""
+    if DB_BACKEND != "sqlite":
+        return connect_sheet()
+    db = LocalSpreadsheet(LOCAL_DB_PATH)
+    if not db.is_seeded():
+        seed_local_db(db)  # 시트 내용으로 채움 (실패하면 시트 사본 스레드가 다시 시도)
+    if MIRROR_TO_SHEET:
+        get_sheet_mirror()
+    return db
+
+@st.cache_resource
+def connect_sheet():
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     creds = None
     if os.path.exists("service_account.json"):
@@ -510,40 +536,136 @@ def connect_db():
     except Exception as e:
         return None
 
+WORKSHEET_TTL = 600  # 워크시트 목록(메타데이터) 재조회 주기
+
+@st.cache_resource
+def get_worksheet_registry():
+    """스프레드시트 메타데이터 캐시: 제목 -> Worksheet, id -> Worksheet"""
+    return {"lock": threading.Lock(), "fetched_at": 0, "by_title": {}, "by_id": {}}
+
+def get_worksheet_maps(sh):
+    """메타데이터는 TTL 동안 한 번만 조회하고 두 가지 맵으로 보관"""
+    reg = get_worksheet_registry()
+    with reg["lock"]:
+        if time.time() - reg["fetched_at"] >= WORKSHEET_TTL:
+            worksheets = sh.worksheets()
+            reg["by_title"] = {ws.title: ws for ws in worksheets}
+            reg["by_id"] = {ws.id: ws for ws in worksheets}
+            reg["fetched_at"] = time.time()
+        return reg["by_title"], reg["by_id"]
+
+def invalidate_worksheet_registry():
+    reg = get_worksheet_registry()
+    with reg["lock"]:
+        reg["fetched_at"] = 0
+
+# -----------------------------------------------------------------------------
+# 시트 스키마 (열 순서 = 시트 헤더 순서, 값 = 로딩 시 한 번 적용할 dtype)
+# -----------------------------------------------------------------------------
+# category: 반복되는 ID/구분/이름값, datetime: 날짜, bool: TRUE/FALSE (그 외 값은 NA → '기타'),
+# int: 인원수·목표값 (빈칸은 0), str: 문자열 그대로
+TABLE_SCHEMAS = {
+    "users": {
+        "user_id": "category", "name": "str", "birth_date": "str", "gender": "category",
+        "phone": "str", "emergency_contact": "str", "address": "str", "family": "str",
+        "registration date": "str", "is_disabled": "bool", "is_beneficiary": "bool",
+        "is_seoul_resident": "bool", "is_school_age": "bool",
+    },
+    "classes": {
+        "class_id": "category", "class_name": "category", "business_category": "category",
+        "education_category": "category", "instructor_name": "category", "start_date": "str",
+    },
+    "education_categories": {
+        "category_id": "category", "business_category": "category", "category_name": "category",
+        "class_type": "category", "category_goal_num": "int", "category_goal_mem": "int",
+    },
+    "attendance": {
+        "attendance_id": "str", "user_id": "category", "class_name": "category", "class_id": "category",
+        "attendance_date": "datetime", "attendance_time": "category", "detail": "str",
+        "submission_token": "str",
+    },
+    "external": {
+        "external_id": "str", "class_id": "category", "class_name": "category",
+        "attendance_date": "datetime", "attendance_time": "category",
+        "external_member": "int", "external_count": "int", "detail": "str",
+        "submission_token": "str",
+    },
+}
+BOOL_VALUES = {"TRUE": True, "FALSE": False}
+
+def table_kind(name):
+    """'attendance_26' -> 'attendance' (연도 접미사 제거)"""
+    base, _, suffix = name.rpartition("_")
+    return base if base and suffix.isdigit() else name
+
+def apply_schema(name, df):
+    """스키마대로 dtype 변환 (이미 변환된 열은 건너뛰므로 여러 번 호출해도 안전)"""
+    converted = {}
+    for col, kind in TABLE_SCHEMAS.get(table_kind(name), {}).items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        if kind == "category" and not isinstance(s.dtype, pd.CategoricalDtype):
+            converted[col] = s.astype("category")
+        elif kind == "datetime" and not pd.api.types.is_datetime64_any_dtype(s):
+            converted[col] = pd.to_datetime(s, errors="coerce")
+        elif kind == "bool" and not pd.api.types.is_bool_dtype(s):
+            converted[col] = s.astype(str).str.strip().str.upper().map(BOOL_VALUES).astype("boolean")
+        elif kind == "int" and not pd.api.types.is_integer_dtype(s):
+            converted[col] = pd.to_numeric(s, errors="coerce").fillna(0).astype("int64")
+    if not converted:
+        return df
+    df = df.copy(deep=False)
+    for col, s in converted.items():
+        df[col] = s
+    return df
+
+def concat_typed(name, frames):
+    """카테고리 범주가 서로 다른 조각을 이어붙인 뒤 스키마 dtype 복원"""
+    frames = [f for f in frames if len(f)] or frames[:1]
+    return apply_schema(name, pd.concat(frames, ignore_index=True))
+
 def get_worksheet(sh, name):
     if sh is None: return None
     try:
-        existing = [ws.title for ws in sh.worksheets()]
-        if name in existing:
-            return sh.worksheet(name)
+        by_title, _ = get_worksheet_maps(sh)
+        if name in by_title:
+            return by_title[name]
         else:
             # 시트가 없으면 새로 생성 (기본 100행, 20열)
             ws = sh.add_worksheet(title=name, rows=100, cols=20)
             
-            # [핵심 변경] '==' 대신 'in'을 써야 '_26'이 붙어도 인식합니다!
-            
-            if "users" in name:
-                ws.append_row(["user_id", "name", "birth_date", "gender", "phone", "emergency_contact", "address", "family", "registration date", "is_disabled", "is_beneficiary", "is_seoul_resident", "is_school_age"])
-            
-            elif "classes" in name:
-                ws.append_row(["class_id", "class_name", "business_category", "education_category", "instructor_name", "start_date"])
-            
-            elif "education_categories" in name:
-                ws.append_row(["category_id", "business_category", "category_name", "class_type"])
-            
-            elif "attendance" in name:
-                ws.append_row(["attendance_id", "user_id", "class_id", "attendance_date", "attendance_time", "detail"])
-            
-            # [추가하신 부분] external 시트 헤더 정의
-            elif "external" in name:
-                # external_id, class_id, 날짜, 시간, 실인원, 연인원
-                ws.append_row(["external_id", "class_id", "attendance_date", "attendance_time", "external_member", "external_count"])
+            # 헤더는 TABLE_SCHEMAS 기준 (table_kind가 '_26' 같은 연도 접미사를 떼고 찾음)
+            # 출석/외부 시트는 저장하는 행 순서 그대로 class_name 열을 포함합니다.
+            header = list(TABLE_SCHEMAS.get(table_kind(name), {}))
+            if header:
+                ws.append_row(header)
             
+            # 새로 만든 시트는 레지스트리에 바로 등록 (메타데이터 재조회 없이)
+            reg = get_worksheet_registry()
+            with reg["lock"]:
+                reg["by_title"][ws.title] = ws
+                reg["by_id"][ws.id] = ws
             return ws
     except Exception as e:
+        # 시트가 외부에서 삭제/이름변경된 경우 등을 위해 다음 호출 때 목록을 다시 받음
+        invalidate_worksheet_registry()
         st.toast(f"⚠️ 구글 시트({name}) 로딩 지연: 잠시 후 다시 시도됩니다.", icon="⏳")
         return None
 
+def sheet_exists(sh, name):
+    """메타데이터에 name 시트가 있는지 (조회 실패 시엔 True - 기존처럼 로딩을 시도하고 실패 경로를 탐)"""
+    try:
+        by_title, _ = get_worksheet_maps(sh)
+    except Exception:
+        invalidate_worksheet_registry()
+        return True
+    return name in by_title
+
+def empty_table(name):
+    """아직 없는 시트 대신 쓰는 빈 표 (스키마 열만 있음 - 시트는 첫 저장 때 get_worksheet가 생성)"""
+    return apply_schema(name, pd.DataFrame(columns=list(TABLE_SCHEMAS.get(table_kind(name), {}))))
+
 @st.cache_data(ttl=300)  # 5분간 캐싱
 def load_sheet_data(sheet_id):
     """구글 시트 데이터를 캐싱하여 로드"""
@@ -551,63 +673,1374 @@ def load_sheet_data(sheet_id):
     if not sh:
         return None
     
-    ws = None
     try:
-        for worksheet in sh.worksheets():
-            if worksheet.id == sheet_id:
-                ws = worksheet
-                break
-        
+        _, by_id = get_worksheet_maps(sh)
+        ws = by_id.get(sheet_id)
         if ws:
             return pd.DataFrame(ws.get_all_records())
         return pd.DataFrame()
     except:
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
+# -----------------------------------------------------------------------------
+# 2-1. 로컬 스냅샷 저장소 (워크시트별 Parquet 사본 + 바뀐 행만 증분 조회)
+# -----------------------------------------------------------------------------
+SNAPSHOT_DIR = ".snapshots"
+SNAPSHOT_TTL = 300          # 이 시간 안에 동기화된 스냅샷은 API 호출 없이 그대로 사용
+SNAPSHOT_FULL_SYNC = 3600   # 시트에서 직접 고친 셀까지 반영하기 위한 전체 재조회 주기
+
+def _snapshot_path(name, ext="parquet"):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.{ext}")
+
+def values_to_frame(values, header=None):
+    """get_all_values() 형태의 2차원 리스트 -> 문자열 DataFrame (헤더 없는 열은 버림)"""
+    if header is None:
+        if not values:
+            return pd.DataFrame()
+        header, values = values[0], values[1:]
+    width = len(header)
+    rows = [(list(r) + [""] * width)[:width] for r in values]
+    df = pd.DataFrame(rows, columns=header, dtype=str)
+    return df.loc[:, [c != "" for c in df.columns]]
+
+def read_snapshot_meta(name):
+    try:
+        with open(_snapshot_path(name, "json"), encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def read_snapshot(name):
+    """스냅샷과 메타정보(동기화 시각) 반환. 없거나 깨졌으면 (None, {})"""
+    path = _snapshot_path(name)
+    if not os.path.exists(path):
+        return None, {}
+    try:
+        return pd.read_parquet(path), read_snapshot_meta(name)
+    except Exception:
+        return None, {}
+
+def write_snapshot(name, df, meta):
+    """임시 파일에 쓴 뒤 교체 (다른 세션이 읽는 도중 깨진 파일을 보지 않도록)"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    path = _snapshot_path(name)
+    df.to_parquet(path + suffix, index=False)
+    os.replace(path + suffix, path)
+    path = _snapshot_path(name, "json")
+    with open(path + suffix, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + suffix, path)
+
+def sync_snapshot(ws, name, snap=None, meta=None):
+    """
+    스냅샷을 시트와 맞춤.
+    - 스냅샷이 없거나 전체 재조회 주기가 지났으면: 시트 전체 1회 조회
+    - 그 외: A열(ID)과 헤더만 받아 스냅샷과 비교하고, 처음 달라진 행부터 끝까지만 조회
+      (출석/외부 시트처럼 뒤에 붙기만 하는 시트는 새로 추가된 행만 받아옴)
+    """
+    now = time.time()
+    meta = meta or {}
+    if snap is None or now - meta.get("full_synced_at", 0) >= SNAPSHOT_FULL_SYNC:
+        df = apply_schema(name, values_to_frame(ws.get_all_values()))
+        write_snapshot(name, df, {"synced_at": now, "full_synced_at": now})
+        return df
+
+    id_range, header_range = ws.batch_get(["A:A", "1:1"])
+    diff = diff_snapshot(snap, id_range, header_range)
+    if diff is None:
+        # 열 구성이 바뀌었으면 증분 비교가 의미 없으므로 전체 재조회
+        return sync_snapshot(ws, name)
+
+    df, header, changed_range = diff
+    if changed_range:
+        df = concat_typed(name, [df, values_to_frame(ws.get(changed_range), header)])
+
+    write_snapshot(name, df, {**meta, "synced_at": now})
+    return df
+
+def diff_snapshot(snap, id_range, header_range):
+    """
+    A열(ID)/헤더 조회 결과를 스냅샷과 비교.
+    반환: None(헤더가 달라 전체 재조회 필요) 또는 (그대로 쓸 앞부분, 헤더, 다시 받을 A1 범위 또는 None)
+    """
+    header = list(header_range[0]) if header_range else []
+    if not header or [h for h in header if h] != list(snap.columns):
+        return None
+
+    sheet_ids = [r[0] if r else "" for r in id_range[1:]]
+    snap_ids = snap.iloc[:, 0].tolist()
+    same = 0
+    for old_id, new_id in zip(snap_ids, sheet_ids):
+        if old_id != new_id:
+            break
+        same += 1
+
+    changed_range = None
+    if same < len(sheet_ids):
+        last_cell = gspread.utils.rowcol_to_a1(len(sheet_ids) + 1, len(header))
+        changed_range = f"A{same + 2}:{last_cell}"
+    return snap.iloc[:same], header, changed_range
+
+def load_snapshot_table(sh, name, force=False):
+    """시트 이름으로 DataFrame 로드 (신선한 스냅샷은 디스크에서 바로, 아니면 증분 동기화)"""
+    if sh is not None and not sheet_exists(sh, name):
+        # 조회만으로 빈 연도 시트를 만들지 않음
+        return empty_table(name)
+    if isinstance(sh, LocalSpreadsheet):
+        # 로컬 DB는 읽기 비용이 작으므로 스냅샷 없이 바로 읽음
+        ws = get_worksheet(sh, name)
+        return apply_schema(name, ws.to_frame()) if ws is not None else pd.DataFrame()
+
+    snap, meta = read_snapshot(name)
+    if snap is not None and not force and time.time() - meta.get("synced_at", 0) < SNAPSHOT_TTL:
+        return snap
+
+    ws = get_worksheet(sh, name)
+    if ws is None:
+        # 구글 API 지연 시 마지막 스냅샷으로라도 화면을 띄움
+        return snap if snap is not None else pd.DataFrame()
+    try:
+        return sync_snapshot(ws, name, snap, meta)
+    except Exception:
+        invalidate_worksheet_registry()
+        return snap if snap is not None else pd.DataFrame()
+
+# -----------------------------------------------------------------------------
+# 2-2. 공용 테이블 캐시 (쓰기 성공 후 해당 테이블만 갱신)
+# -----------------------------------------------------------------------------
+# 모든 세션이 같은 캐시를 공유하므로, 한 세션에서 등록/수정/삭제하면
+# 다른 세션도 시트를 다시 받지 않고 바로 바뀐 데이터를 보게 됩니다.
+@st.cache_resource
+def get_table_cache():
+    """{시트명: {"df": DataFrame, "version": int, "loaded_at": float}}"""
+    return {"lock": threading.Lock(), "snapshot_lock": threading.Lock(), "tables": {}}
+
+def load_table(name):
+    """캐시된 테이블 반환 (TTL 지났거나 새로고침 요청 시 스냅샷 증분 동기화)"""
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"].get(name)
+        if entry and (entry.get("sealed") or time.time() - entry["loaded_at"] < SNAPSHOT_TTL):
+            return entry["df"]
+        force = bool(entry and entry.get("force"))
+        seen_version = entry["version"] if entry else 0
+
+    # 보관(마감)된 연도는 로컬 Parquet에서 읽고 다시 동기화하지 않음
+    archived = read_archive(name)
+    if archived is not None:
+        return _install_table(name, archived, seen_version, sealed=True)
+
+    # 네트워크 요청은 락 밖에서 수행
+    df = load_snapshot_table(connect_db(), name, force=force)
+    return _install_table(name, df, seen_version)
+
+def _install_table(name, df, seen_version, sealed=False):
+    """새로 읽어온 테이블을 캐시에 넣음 (로딩 도중 다른 세션이 쓰기 반영을 했으면 그쪽이 최신)"""
+    df = apply_schema(name, df)  # 이전 형식(문자열) 스냅샷 대비
+    df = merge_pending_rows(name, df)  # 아직 시트에 못 올라간 대기열 행은 계속 보이도록
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"].get(name)
+        if entry and entry["version"] != seen_version:
+            return entry["df"]
+        cache["tables"][name] = {"df": df, "version": seen_version + 1, "loaded_at": time.time(), "sealed": sealed}
+    return df
+
+def prefetch_tables(names):
+    """
+    여러 시트를 Sheets values:batchGet 한 번에 받아 테이블 캐시를 채움.
+    - 스냅샷이 없는 시트: 시트 전체 범위
+    - 스냅샷이 있는 시트: A열/헤더만 받아 비교 후, 바뀐 구간이 있으면 그 구간들만 한 번 더 batchGet
+    실패하면 아무것도 하지 않음 (이후 get_cached_*가 시트별로 개별 로딩)
+    """
+    sh = connect_db()
+    cache = get_table_cache()
+    now = time.time()
+    pending = {}
+    with cache["lock"]:
+        for name in dict.fromkeys(names):
+            entry = cache["tables"].get(name)
+            if entry and (entry.get("sealed") or now - entry["loaded_at"] < SNAPSHOT_TTL):
+                continue
+            if is_archived(name):  # 보관된 연도는 load_table이 디스크에서 읽음
+                continue
+            pending[name] = (bool(entry and entry.get("force")), entry["version"] if entry else 0)
+    if not pending or sh is None:
+        return
+    # 없는 연도 시트는 만들지 않고 빈 표로 채움 (없는 시트가 섞이면 batchGet 전체가 실패하므로 요청에서 뺌)
+    for name in [name for name in pending if not sheet_exists(sh, name)]:
+        _install_table(name, empty_table(name), pending.pop(name)[1])
+    if not pending:
+        return
+    if isinstance(sh, LocalSpreadsheet):
+        for name, (_, seen_version) in pending.items():
+            _install_table(name, load_snapshot_table(sh, name), seen_version)
+        return
+    if any(get_worksheet(sh, name) is None for name in pending):
+        return
+
+    loaded, full, probe = {}, [], []
+    for name, (force, _) in pending.items():
+        snap, meta = read_snapshot(name)
+        if snap is not None and not force and now - meta.get("synced_at", 0) < SNAPSHOT_TTL:
+            loaded[name] = snap
+        elif snap is None or now - meta.get("full_synced_at", 0) >= SNAPSHOT_FULL_SYNC:
+            full.append(name)
+        else:
+            probe.append((name, snap, meta))
+
+    def batch_get(ranges):
+        value_ranges = sh.values_batch_get(ranges)["valueRanges"]
+        return [vr.get("values", []) for vr in value_ranges]
+
+    a1 = gspread.utils.absolute_range_name
+    ranges = [a1(name) for name in full]
+    for name, _, _ in probe:
+        ranges += [a1(name, "A:A"), a1(name, "1:1")]
+
+    try:
+        values = batch_get(ranges) if ranges else []
+        for name, sheet_values in zip(full, values):
+            loaded[name] = apply_schema(name, values_to_frame(sheet_values))
+            write_snapshot(name, loaded[name], {"synced_at": now, "full_synced_at": now})
+
+        changed = []
+        for i, (name, snap, meta) in enumerate(probe):
+            k = len(full) + 2 * i
+            diff = diff_snapshot(snap, values[k], values[k + 1])
+            if diff is None:
+                loaded[name] = sync_snapshot(get_worksheet(sh, name), name)
+                continue
+            df, header, changed_range = diff
+            if changed_range:
+                changed.append((name, df, header, meta, changed_range))
+            else:
+                loaded[name] = df
+                write_snapshot(name, df, {**meta, "synced_at": now})
+
+        if changed:
+            tails = batch_get([a1(name, rng) for name, _, _, _, rng in changed])
+            for (name, df, header, meta, _), tail in zip(changed, tails):
+                loaded[name] = concat_typed(name, [df, values_to_frame(tail, header)])
+                write_snapshot(name, loaded[name], {**meta, "synced_at": now})
+    except Exception:
+        invalidate_worksheet_registry()
+        return
+
+    for name, df in loaded.items():
+        _install_table(name, df, pending[name][1])
+
+def get_table_version(name):
+    entry = get_table_cache()["tables"].get(name)
+    return entry["version"] if entry else 0
+
+def refresh_tables():
+    """새로고침 버튼: 다음 조회 때 모든 테이블을 시트와 다시 맞춤"""
+    cache = get_table_cache()
+    with cache["lock"]:
+        for entry in cache["tables"].values():
+            entry["loaded_at"] = 0
+            entry["force"] = True
+
+def invalidate_table(name):
+    """name 테이블만 다음 조회 때 시트와 다시 맞춤"""
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"].get(name)
+        if entry:
+            entry["loaded_at"] = 0
+            entry["force"] = True
+
+def _replace_table(name, df, base=None):
+    """
+    테이블 교체 + 버전 증가 + 스냅샷 기록 (읽는 중인 세션이 있으므로 제자리 수정하지 않음).
+    base를 주면 캐시의 현재 표가 base일 때만 교체하고, 그 사이 다른 세션이 바꿨으면 False.
+    """
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"].get(name)
+        if base is not None and (entry["df"] if entry else None) is not base:
+            return False
+        version = entry["version"] + 1 if entry else 1
+        loaded_at = entry["loaded_at"] if entry else time.time()
+        cache["tables"][name] = {"df": df, "version": version, "loaded_at": loaded_at}
+    # 스냅샷은 쓰는 순간의 최신 표로 기록 (동시에 교체한 세션끼리 오래된 표로 덮어쓰지 않도록)
+    try:
+        with cache["snapshot_lock"]:
+            with cache["lock"]:
+                latest = cache["tables"][name]["df"]
+            write_snapshot(name, latest, read_snapshot_meta(name))
+    except Exception:
+        pass
+    return True
+
+def _patch_table(name, patch):
+    """
+    load_table -> patch(df) -> 교체를 한 번의 변경으로 반영 (patch가 None이면 그대로 둠).
+    계산하는 사이 다른 세션이 같은 테이블을 바꿨으면 (예: 두 강사가 동시에 출석 등록) 바뀐 표로 다시 계산합니다.
+    """
+    while True:
+        df = load_table(name)
+        new_df = patch(df)
+        if new_df is None or _replace_table(name, new_df, base=df):
+            return
+
+def table_append(name, rows):
+    """append_row(s) 성공 후 호출"""
+    _patch_table(name, lambda df: concat_typed(name, [df, values_to_frame(rows, list(df.columns))]))
+
+def table_update(name, key, values):
+    """update 성공 후 호출 (첫 번째 열이 key인 행을 values로 교체)"""
+    def patch(df):
+        hits = (df.iloc[:, 0] == str(key)).to_numpy().nonzero()[0]
+        if not len(hits):
+            return None
+        pos = hits[0]
+        # 시트 update 범위(A~)와 같게 앞쪽 열만 교체 (새 값은 범주에 없을 수 있어 행 단위로 다시 이어붙임)
+        row = df.iloc[[pos]].astype(object)
+        new_values = [str(v) for v in values][:len(df.columns)]
+        row.iloc[0, :len(new_values)] = new_values
+        return concat_typed(name, [df.iloc[:pos], row, df.iloc[pos + 1:]])
+    _patch_table(name, patch)
+
+def table_delete(name, key):
+    """delete_rows 성공 후 호출"""
+    def patch(df):
+        mask = (df.iloc[:, 0] == str(key)).to_numpy()
+        return df[~mask].reset_index(drop=True) if mask.any() else None
+    _patch_table(name, patch)
+
+def table_ids(name):
+    """첫 번째 열(ID)의 해시 인덱스 (테이블 버전마다 한 번 생성) - 위치 조회와 중복 확인에 같이 씀"""
+    load_table(name)
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"][name]
+        if "row_index" not in entry:
+            entry["row_index"] = pd.Index(entry["df"].iloc[:, 0].astype(object))
+        return entry["row_index"]
+
+def find_row(ws, name, key):
+    """
+    첫 번째 열(ID)이 key인 행의 시트 행 번호.
+    캐시된 테이블이 시트와 같은 순서이므로 위치 + 2(헤더 1행, 1부터 시작)로 계산하고, 그 행의 A열 1칸만 읽어 확인합니다.
+    (시트에서 직접 정렬·편집했거나 아직 동기화 전이면 캐시 위치가 다른 행을 가리킬 수 있음)
+    캐시에 없거나 확인이 어긋나면 ws.find로 A열을 검색하고, 어긋난 캐시는 다음 조회 때 다시 맞춥니다.
+    """
+    hits = table_ids(name).get_indexer_for([str(key)])
+    if len(hits) and hits[0] >= 0:
+        row = int(hits[0]) + 2
+        cell = ws.get(f"A{row}")
+        if cell and cell[0] and cell[0][0] == str(key):
+            return row
+        invalidate_table(name)
+    cell = ws.find(str(key), in_column=1)
+    if cell is None:
+        raise ValueError(f"시트에서 ID '{key}'를 찾을 수 없습니다.")
+    return cell.row
+
+# [추가] 선택창 옵션 목록 (테이블 버전마다 한 번 생성): ID 목록 + 표시 이름 + 검색용 키(소문자/초성)
+CHOSUNG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+CHOSUNG_TABLE = {0xAC00 + i: CHOSUNG[i // 588] for i in range(11172)}  # 한글 음절 -> 초성
+OPTION_FORMATS = {
+    "users": ("user_id", ["name"], "{name} ({id})"),
+    "classes": ("class_id", ["class_name", "instructor_name"], "{class_name} - {instructor_name} ({id})"),
+}
+
+def get_option_catalog(name):
+    """
+    name 테이블의 선택창 옵션 DataFrame (id, label, key, cho).
+    selectbox에는 id를 옵션으로, label을 format_func로 넘기면 선택값에서 ID를 따로 잘라낼 필요가 없습니다.
+    """
+    df = load_table(name)
+    cache = get_table_cache()
+    with cache["lock"]:
+        entry = cache["tables"][name]
+        if "catalog" in entry:
+            return entry["catalog"]
+    id_col, text_cols, _ = OPTION_FORMATS[table_kind(name)]
+    text = {c: df[c].astype(object).fillna("").astype(str) for c in text_cols}
+    ids = df[id_col].astype(object).fillna("").astype(str)
+    label = text[text_cols[0]]
+    if len(text_cols) > 1:
+        label = label + " - " + text[text_cols[1]]
+    catalog = pd.DataFrame({
+        "id": ids,
+        "label": label + " (" + ids + ")",
+        "key": text[text_cols[0]].str.lower(),
+        "cho": text[text_cols[0]].str.translate(CHOSUNG_TABLE),
+    }).drop_duplicates("id").reset_index(drop=True)
+    catalog.attrs["labels"] = dict(zip(catalog["id"], catalog["label"]))
+    with cache["lock"]:
+        if cache["tables"].get(name) is entry:
+            entry["catalog"] = catalog
+    return catalog
+
+def search_options(catalog, query):
+    """
+    검색어로 옵션 ID 목록을 좁힘. 앞글자가 같은 항목을 먼저, 그다음 포함하는 항목.
+    검색어가 초성으로만 되어 있으면(예: 'ㅎㄱㄷ') 이름의 초성과 비교합니다.
+    """
+    query = (query or "").strip().lower()
+    if not query:
+        return catalog["id"].tolist()
+    target = catalog["cho"] if all(ch in CHOSUNG for ch in query.replace(" ", "")) else catalog["key"]
+    prefix = target.str.startswith(query).to_numpy()
+    contains = (target.str.contains(query, regex=False) | catalog["label"].str.lower().str.contains(query, regex=False)).to_numpy()
+    return catalog["id"][prefix].tolist() + catalog["id"][contains & ~prefix].tolist()
+
 def get_cached_users():
     """users 시트 캐싱"""
-    sh = connect_db()
-    ws = get_worksheet(sh, "users")
-    if ws:
-        return pd.DataFrame(ws.get_all_records())
-    return pd.DataFrame()
+    return load_table("users").copy()
 
-@st.cache_data(ttl=300)
 def get_cached_attendance(year_suffix):
     """attendance 시트 캐싱"""
-    sh = connect_db()
-    ws = get_worksheet(sh, f"attendance_{year_suffix}")
-    if ws:
-        return pd.DataFrame(ws.get_all_records())
-    return pd.DataFrame()
+    return load_table(f"attendance_{year_suffix}").copy()
 
-@st.cache_data(ttl=300)
 def get_cached_classes(year_suffix):
     """classes 시트 캐싱"""
-    sh = connect_db()
-    ws = get_worksheet(sh, f"classes_{year_suffix}")
-    if ws:
-        return pd.DataFrame(ws.get_all_records())
-    return pd.DataFrame()
+    return load_table(f"classes_{year_suffix}").copy()
 
-@st.cache_data(ttl=300)
 def get_cached_external(year_suffix):
     """external 시트 캐싱"""
-    sh = connect_db()
-    ws = get_worksheet(sh, f"external_{year_suffix}")
-    if ws:
-        return pd.DataFrame(ws.get_all_records())
-    return pd.DataFrame()
+    return load_table(f"external_{year_suffix}").copy()
 
-@st.cache_data(ttl=300)
 def get_cached_edu_categories():
     """education_categories 시트 캐싱"""
+    return load_table("education_categories").copy()
+
+# [추가] 생일 인덱스: users 테이블 버전마다 한 번만 생성 (월*100+일 기준 정렬 배열)
+@st.cache_resource
+def get_birthday_cache():
+    return {"lock": threading.Lock(), "version": None, "index": None}
+
+def build_birthday_index(df_u):
+    """birth_date(YYYY/MM/DD 등 숫자 8자리)를 한 번에 파싱해 생일(월*100+일) 순으로 정렬한 표 생성"""
+    if df_u.empty or 'birth_date' not in df_u.columns:
+        return pd.DataFrame({"md": pd.Series(dtype="int64"), "pos": pd.Series(dtype="int64"), "label": pd.Series(dtype=object)})
+    nums = df_u['birth_date'].astype(object).fillna("").astype(str).str.replace(r"\D", "", regex=True)
+    born = pd.to_datetime(nums.where(nums.str.len() == 8), format="%Y%m%d", errors="coerce")
+    ok = born.notna().to_numpy()
+    month = born.dt.month.to_numpy()[ok].astype(np.int64)
+    day = born.dt.day.to_numpy()[ok].astype(np.int64)
+    names = df_u['name'].astype(object).fillna("이름없음").to_numpy()[ok] if 'name' in df_u.columns else np.full(ok.sum(), "이름없음", dtype=object)
+    index = pd.DataFrame({
+        "md": month * 100 + day,
+        "pos": np.flatnonzero(ok),
+        "label": [f"{n} ({m}/{d}" for n, m, d in zip(names, month, day)],  # 닫는 괄호는 조회 시 D-Day와 함께
+    })
+    return index.sort_values("md", kind="stable").reset_index(drop=True)
+
+def get_birthday_index():
+    """users 테이블이 바뀌었을 때(로드·추가·수정·삭제로 버전 증가)만 인덱스 재생성"""
+    df_u = load_table("users")
+    version = get_table_version("users")
+    cache = get_birthday_cache()
+    with cache["lock"]:
+        if cache["version"] == version and cache["index"] is not None:
+            return cache["index"]
+    index = build_birthday_index(df_u)
+    with cache["lock"]:
+        cache["version"], cache["index"] = version, index
+    return index
+
+def find_birthdays(index, today, ahead=14, behind=7):
+    """
+    오늘 / ahead일 이내 다가오는 / behind일 이내 지난 생일 목록 반환.
+    조회 구간의 날짜마다 정렬된 md 배열에서 searchsorted로 범위를 잘라냄 (연말/연초는 날짜 연산으로 자연히 처리).
+    2월 29일 생일은 윤년이 아니면 2월 28일로 취급.
+    """
+    offsets = np.arange(-behind, ahead + 1)
+    days = [today + timedelta(days=int(o)) for o in offsets]
+    keys = np.array([d.month * 100 + d.day for d in days], dtype=np.int64)
+    md = index["md"].to_numpy()
+    lo = np.searchsorted(md, keys, side="left")
+    hi = np.searchsorted(md, keys, side="right")
+    # 평년 2/28에는 2/29 생일자도 포함
+    leap_lo, leap_hi = np.searchsorted(md, 229, side="left"), np.searchsorted(md, 229, side="right")
+    labels, pos = index["label"].to_numpy(), index["pos"].to_numpy()
+
+    def hits(i):
+        d = days[i]
+        if d.month == 2 and d.day == 28 and not calendar.isleap(d.year):
+            rows = np.r_[lo[i]:hi[i], leap_lo:leap_hi]
+            return list(labels[rows[np.argsort(pos[rows], kind="stable")]])  # 등록 순서 유지
+        return list(labels[lo[i]:hi[i]])
+
+    today_list = [f"{x})" for x in hits(behind)]
+    upcoming = [f"{x}, D-{offsets[i]})" for i in range(behind + 1, len(days)) for x in hits(i)]
+    past = [f"{x})" for i in range(behind - 1, -1, -1) for x in hits(i)]  # 최근 순
+    return today_list, upcoming, past
+# -----------------------------------------------------------------------------
+# 2-3. 출석 저장 대기열 (로컬 SQLite에 먼저 기록 -> 백그라운드에서 시트로 묶어 전송)
+# -----------------------------------------------------------------------------
+# 등록 버튼은 대기열 기록 + 캐시 반영만 하고 바로 끝납니다. 시트 전송은 작업 스레드가
+# 시트별로 모아 append_rows 1회로 보내고, 실패하면 간격을 늘려가며 다시 시도합니다.
+OUTBOX_PATH = os.path.join(SNAPSHOT_DIR, "outbox.sqlite3")
+OUTBOX_POLL = 5             # 작업 스레드가 대기열을 확인하는 주기(초)
+OUTBOX_BACKOFF = 5          # 첫 재시도 간격(초), 실패할 때마다 2배
+OUTBOX_BACKOFF_MAX = 300    # 재시도 간격 상한(초)
+OUTBOX_CHUNK = 2000         # append_rows 1회에 보내는 최대 행 수 (일괄 가져오기 등 큰 묶음은 나눠 전송)
+OUTBOX_CHUNK_PAUSE = 1.0    # 묶음 사이 대기(초) - 분당 쓰기 요청 한도 안에 머물도록
+
+def _outbox_db():
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    con = sqlite3.connect(OUTBOX_PATH, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT NOT NULL, row TEXT NOT NULL,"
+        " created_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+        " next_try REAL NOT NULL DEFAULT 0, last_error TEXT)"
+    )
+    return con
+
+@st.cache_resource
+def get_outbox():
+    """대기열 작업 스레드 (프로세스당 1개, 이전 실행에서 남은 행도 이어서 전송)"""
+    state = {"event": threading.Event()}
+    state["thread"] = threading.Thread(target=_outbox_worker, args=(state,), daemon=True, name="outbox")
+    state["thread"].start()
+    return state
+
+def _outbox_worker(state):
+    while True:
+        state["event"].wait(OUTBOX_POLL)
+        state["event"].clear()
+        try:
+            flush_outbox()
+            state["last_error"] = None
+        except Exception as e:
+            # 시트별 오류는 flush_outbox가 행에 기록함 - 여기는 대기열 DB 자체의 오류 등
+            state["last_error"] = str(e)
+            logging.exception("출석 대기열 전송 중 오류")
+
+def enqueue_rows(name, rows):
+    """행을 대기열에 기록하고 캐시에 바로 반영 (시트 전송은 백그라운드)"""
+    now = time.time()
+    con = _outbox_db()
+    try:
+        with con:
+            con.executemany(
+                "INSERT INTO outbox (sheet, row, created_at) VALUES (?, ?, ?)",
+                [(name, json.dumps(list(r), ensure_ascii=False), now) for r in rows],
+            )
+    finally:
+        con.close()
+    try:
+        table_append(name, rows)
+    except Exception:
+        # 대기열에는 이미 기록됨: 여기서 예외를 올리면 호출한 쪽이 토큰을 풀어 재시도 때 두 번 저장되므로
+        # 캐시만 다음 조회 때 다시 읽도록 표시 (대기 중인 행은 merge_pending_rows가 붙여 줌)
+        invalidate_table(name)
+    get_outbox()["event"].set()
+
+def pending_rows(name):
+    """name 시트로 아직 전송되지 않은 행 목록"""
+    if not os.path.exists(OUTBOX_PATH):
+        return []
+    con = _outbox_db()
+    try:
+        return [json.loads(r) for (r,) in con.execute("SELECT row FROM outbox WHERE sheet = ? ORDER BY id", (name,))]
+    finally:
+        con.close()
+
+def merge_pending_rows(name, df):
+    """시트에서 새로 읽은 테이블에 대기 중인 행을 덧붙임 (ID가 이미 있으면 전송된 것으로 봄)"""
+    rows = pending_rows(name)
+    if not rows or not len(df.columns):  # 헤더만 있는 새 시트(1월의 attendance_YY 등)에도 붙여야 함
+        return df
+    pending = values_to_frame(rows, list(df.columns))
+    pending = pending[~pending.iloc[:, 0].isin(df.iloc[:, 0].astype(object))]
+    return concat_typed(name, [df, pending]) if len(pending) else df
+
+def flush_outbox():
+    """전송할 때가 된 행을 시트별로 모아 OUTBOX_CHUNK 행씩 append_rows로 전송 (보낸 묶음은 바로 대기열에서 삭제)"""
+    now = time.time()
+    con = _outbox_db()
+    try:
+        due = con.execute(
+            "SELECT id, sheet, row, attempts FROM outbox WHERE next_try <= ? ORDER BY id", (now,)
+        ).fetchall()
+        by_sheet = {}
+        for row_id, name, row, attempts in due:
+            by_sheet.setdefault(name, []).append((row_id, json.loads(row), attempts))
+
+        sh = None
+        for name, items in by_sheet.items():
+            sent = 0
+            try:
+                if sh is None:
+                    sh = connect_db()  # 연결 실패도 아래에서 시트별 시도 횟수/재시도 시각/오류로 기록
+                ws = get_worksheet(sh, name)
+                if ws is None:
+                    raise RuntimeError(f"워크시트({name})를 열 수 없습니다.")
+                if any(a for _, _, a in items):
+                    # 이전 시도가 시간 초과나 전송 도중 재시작 등으로 실제로는 저장됐을 수 있으므로 ID 열만 읽어 걸러냄
+                    landed = landed_ids(ws)
+                    with con:
+                        con.executemany(
+                            "DELETE FROM outbox WHERE id = ?",
+                            [(row_id,) for row_id, row, _ in items if row and row[0] in landed],
+                        )
+                    items = [item for item in items if not item[1] or item[1][0] not in landed]
+                while sent < len(items):
+                    if sent:
+                        time.sleep(OUTBOX_CHUNK_PAUSE)
+                    chunk = items[sent:sent + OUTBOX_CHUNK]
+                    # 보내기 전에 시도 횟수부터 올려 커밋: 전송 후 삭제 전에 프로세스가 끝나도
+                    # 다음 전송에서 위의 ID 확인을 거치므로 같은 행이 두 번 저장되지 않음
+                    with con:
+                        con.executemany(
+                            "UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(row_id,) for row_id, _, _ in chunk]
+                        )
+                    ws.append_rows([row for _, row, _ in chunk])
+                    with con:
+                        con.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id, _, _ in chunk])
+                    sent += len(chunk)
+            except Exception as e:
+                rest = items[sent:]
+                attempts = max(a for _, _, a in rest) + 1
+                delay = min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+                with con:
+                    con.executemany(
+                        "UPDATE outbox SET attempts = ?, next_try = ?, last_error = ? WHERE id = ?",
+                        [(attempts, now + delay, str(e)[:500], row_id) for row_id, _, _ in rest],
+                    )
+    finally:
+        con.close()
+
+# [추가] 제출 토큰 (폼을 그릴 때마다 1개) - 같은 토큰의 등록은 한 번만 저장
+# 최근 토큰은 메모리 LRU로 바로 확인하고, 재시작 후에는 캐시된 테이블의 submission_token 열로 확인합니다.
+TOKEN_LRU_SIZE = 4096
+
+@st.cache_resource
+def get_token_store():
+    return {"lock": threading.Lock(), "recent": OrderedDict()}
+
+def claim_token(name, token):
+    """처음 보는 토큰이면 등록하고 True, 이미 처리된 토큰이면 False"""
+    store = get_token_store()
+    with store["lock"]:
+        if token in store["recent"]:
+            store["recent"].move_to_end(token)
+            return False
+    df = load_table(name)
+    if "submission_token" in df.columns and (df["submission_token"] == token).any():
+        seen = True
+    else:
+        seen = False
+    with store["lock"]:
+        if token in store["recent"]:
+            return False
+        store["recent"][token] = name
+        while len(store["recent"]) > TOKEN_LRU_SIZE:
+            store["recent"].popitem(last=False)
+    return not seen
+
+def release_token(token):
+    """저장 자체가 실패했을 때 같은 토큰으로 다시 시도할 수 있도록 해제"""
+    store = get_token_store()
+    with store["lock"]:
+        store["recent"].pop(token, None)
+
+def ensure_token_column(ws, name):
+    """
+    기존 시트 헤더에 submission_token 열이 없으면 헤더 칸만 채움 (시트당 1회).
+    로딩에 실패해 열 정보가 없거나, 그 칸에 이미 다른 헤더가 있으면 시트를 건드리지 않습니다.
+    """
+    df = load_table(name)
+    if "submission_token" in df.columns or not len(df.columns):
+        return
+    col = list(TABLE_SCHEMAS[table_kind(name)]).index("submission_token") + 1
+    a1 = gspread.utils.rowcol_to_a1(1, col)
+    current = ws.get(a1)
+    if current and current[0] and current[0][0]:
+        if current[0][0] == "submission_token":  # 시트엔 이미 있음 -> 캐시만 오래된 것
+            invalidate_table(name)
+        return
+    ws.update(a1, [["submission_token"]])
+    _patch_table(name, lambda df: None if "submission_token" in df.columns else df.assign(submission_token=""))
+
+def landed_ids(ws):
+    """시트 ID 열(1열 조회)에 이미 있는 ID 집합 - 행마다 ID가 다르므로 나눠 보내다 끊긴 묶음도 정확히 걸러짐"""
+    return set(ws.col_values(1)[1:])
+
+def outbox_status():
+    """(대기 건수, 마지막 오류) - 대기열이 비어 있으면 (0, None)"""
+    if not os.path.exists(OUTBOX_PATH):
+        return 0, None
+    state = get_outbox()  # 재시작 후 남은 행이 있으면 전송 재개
+    con = _outbox_db()
+    try:
+        count, = con.execute("SELECT COUNT(*) FROM outbox").fetchone()
+        err = con.execute("SELECT last_error FROM outbox WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 1").fetchone()
+        return count, err[0] if err else (state.get("last_error") if count else None)
+    finally:
+        con.close()
+# -----------------------------------------------------------------------------
+# 2-4. 연도별 파티션 (attendance_YY / classes_YY / external_YY 를 필요한 연도만 로드)
+# -----------------------------------------------------------------------------
+# 각 연도 시트는 공용 테이블 캐시에 따로 들어가므로, 여러 연도를 볼 때도 조회한 연도만 읽습니다.
+# 병합(출석+수업+이용자) 결과는 연도별 팩트 테이블로 한 번만 만들어 둡니다 (날짜순 정렬).
+FIRST_YEAR = 2025
+YEAR_TABLES = ("attendance", "classes", "external")
+
+def dataset_years():
+    """조회 가능한 연도 목록 (FIRST_YEAR ~ 올해)"""
+    return list(range(FIRST_YEAR, datetime.now().year + 1))
+
+def year_sheet(kind, year):
+    """('attendance', 2026) -> 'attendance_26'"""
+    return f"{kind}_{str(year)[2:]}"
+
+def merge_attendance(df_a, df_c, df_u):
+    """출석 + 수업 + 이용자 병합 (class_name 중복은 수업 쪽 이름 사용)"""
+    return df_a.merge(df_c, on='class_id', how='left', suffixes=('_att', '')).merge(df_u, on='user_id', how='left')
+
+# [추가] 출석 팩트 테이블: 출석 1건 = 1행에 수업·이용자 정보를 미리 붙여 둔 표 (연도별)
+# user_key / class_key는 category 코드(정수 대리키), 이용자·수업별 행은 fact_index 보조 인덱스로 찾습니다.
+# 수업·이용자 테이블이 그대로이고 출석이 뒤에 추가만 됐으면 새 출석 행만 병합해 이어붙입니다.
+@st.cache_resource
+def get_fact_cache():
+    return {"lock": threading.Lock(), "facts": {}}
+
+def _type_fact(df):
+    """병합/이어붙이기로 object가 된 열을 스키마 dtype으로 되돌리고 대리키 갱신"""
+    for kind in ("attendance", "classes", "users"):
+        df = apply_schema(kind, df)
+    return df.assign(user_key=df['user_id'].cat.codes, class_key=df['class_id'].cat.codes)
+
+def get_fact_table(year):
+    """year의 출석 팩트 테이블 (페이지는 이 표를 그대로 필터링해서 씀, 복사하지 말고 읽기만)"""
+    a_name, c_name, u_name = year_sheet("attendance", year), year_sheet("classes", year), users_table(year)
+    df_a, df_c, df_u = load_table(a_name), load_table(c_name), load_table(u_name)
+    # 로딩 실패로 열이 없는 테이블은 빈 스키마 표로 대체 (병합 키 누락 방지)
+    df_a, df_c, df_u = (
+        df if key in df.columns else apply_schema(kind, pd.DataFrame(columns=list(TABLE_SCHEMAS[kind])))
+        for df, key, kind in ((df_a, "class_id", "attendance"), (df_c, "class_id", "classes"), (df_u, "user_id", "users"))
+    )
+    dims = (get_table_version(c_name), get_table_version(u_name))
+    att_version = get_table_version(a_name)
+
+    cache = get_fact_cache()
+    with cache["lock"]:
+        hit = cache["facts"].get(year)
+    if hit and hit["dims"] == dims and hit["att_version"] == att_version:
+        return hit["df"]
+
+    ids = df_a.iloc[:, 0].to_numpy(dtype=object) if len(df_a.columns) else np.array([], dtype=object)
+    n = len(hit["ids"]) if hit else 0
+    if hit and hit["dims"] == dims and len(ids) >= n and np.array_equal(ids[:n], hit["ids"]):
+        # 출석이 뒤에 추가만 된 경우: 새 행만 병합
+        df = _type_fact(pd.concat([hit["df"], merge_attendance(df_a.iloc[n:], df_c, df_u)], ignore_index=True))
+    else:
+        df = _type_fact(merge_attendance(df_a, df_c, df_u))
+    # 기간 필터(slice_period)가 이진 탐색으로 자를 수 있도록 날짜순 유지 (날짜 없는 행은 맨 뒤)
+    df = df.sort_values('attendance_date', kind='stable', ignore_index=True)
+
+    with cache["lock"]:
+        cache["facts"][year] = {"dims": dims, "att_version": att_version, "ids": ids, "df": df}
+    return df
+
+def fact_index(year, col):
+    """
+    팩트 테이블의 보조 인덱스 {col 값: 행 위치 배열} (user_id / class_id).
+    팩트 테이블이 바뀔 때마다 새로 만들어지므로 그 버전에서 한 번만 groupby.
+    """
+    fact = get_fact_table(year)
+    cache = get_fact_cache()
+    with cache["lock"]:
+        entry = cache["facts"][year]
+        indexes = entry.setdefault("indexes", {})
+        if entry["df"] is fact and col in indexes:
+            return fact, indexes[col]
+    index = fact.groupby(col, observed=True, sort=False).indices
+    with cache["lock"]:
+        if entry["df"] is fact:
+            indexes[col] = index
+    return fact, index
+
+def fact_select(year, col, value):
+    """year 팩트 테이블에서 col == value 인 행 (보조 인덱스로 해당 행만 꺼냄, O(k))"""
+    fact, index = fact_index(year, col)
+    return fact.take(index.get(value, np.array([], dtype=np.intp)))
+
+def load_year_partitions(years):
+    """years의 출석/수업/외부 시트를 한 번의 batchGet으로 채운 뒤 연도별 dict로 반환"""
+    prefetch_tables(["users"] + [year_sheet(kind, y) for y in years for kind in YEAR_TABLES])
+    return {y: {kind: load_table(year_sheet(kind, y)) for kind in YEAR_TABLES} for y in years}
+
+def load_merged_years(years):
+    """연도별 팩트 테이블을 이어붙여 반환 ('year' 열 추가). 조회한 연도만 로드"""
+    load_year_partitions(years)
+    frames = [get_fact_table(y).assign(year=y) for y in years]
+    frames = [f for f in frames if len(f)] or frames[:1]
+    # 연도마다 범주가 달라 이어붙이면 object가 되는 열은 다시 category로
+    return _type_fact(pd.concat(frames, ignore_index=True))
+
+def users_table(year):
+    """보관된 연도는 보관 시점의 이용자 명단(users_YY), 그 외는 현재 명단"""
+    return year_sheet("users", year) if is_year_sealed(year) else "users"
+
+def compare_years(years, months=None):
+    """
+    연도별 4가지 인원 + 월별 추이를 함께 반환.
+    months를 주면 각 연도에서 같은 달만 비교 (예: 올해 진행된 달까지만).
+    로컬 DB 사용 시 보관 전 연도는 DB 안에서 바로 집계합니다 (저장 대기 중인 출석이 없을 때).
+    """
+    db = connect_db()
+    if isinstance(db, LocalSpreadsheet) and not any(
+        is_year_sealed(y) or pending_rows(year_sheet("attendance", y)) for y in years
+    ):
+        result = compare_years_sql(db, years, months)
+        if result is not None:
+            return result
+    df = load_merged_years(years)
+    if months is not None and len(df):
+        df = df[df['attendance_date'].dt.month.isin(months)]
+    summary, trends = [], []
+    for y in years:
+        sub = df[df['year'] == y] if len(df) else df
+        real, cum, subj, subj_half = calculate_stat_metrics(sub)
+        summary.append({"연도": f"{y}년", "실인원": real, "연인원": cum, "과목구분실인원": subj, "과목반기구분실인원": subj_half})
+        trend = calculate_trend(sub)
+        trend.insert(0, "연도", f"{y}년")
+        trends.append(trend)
+    return pd.DataFrame(summary), pd.concat(trends, ignore_index=True)
+# -----------------------------------------------------------------------------
+# 2-5. 지난 연도 보관 (마감된 연도의 시트를 zstd Parquet로 고정 -> 이후 API 호출 없이 로컬에서 조회)
+# -----------------------------------------------------------------------------
+# 보관 파일: .archive/{시트명}.parquet (+ 이용자 명단 users_YY), 마지막에 manifest_YY.json을 써야 보관 완료.
+# 보관을 되돌리려면 해당 연도의 manifest 파일을 지우면 다시 시트에서 읽습니다.
+ARCHIVE_DIR = ".archive"
+
+def _manifest_path(year):
+    return os.path.join(ARCHIVE_DIR, f"manifest_{str(year)[2:]}.json")
+
+def read_manifest(year):
+    try:
+        with open(_manifest_path(year), encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def is_year_sealed(year):
+    return os.path.exists(_manifest_path(year))
+
+def is_archived(name):
+    """'attendance_25' 처럼 연도가 붙은 시트이고 그 연도가 보관 완료됐는지"""
+    _, _, suffix = name.rpartition("_")
+    return suffix.isdigit() and len(suffix) == 2 and is_year_sealed(2000 + int(suffix))
+
+def read_archive(name):
+    """보관된 시트면 DataFrame, 아니면 None"""
+    if not is_archived(name):
+        return None
+    path = os.path.join(ARCHIVE_DIR, f"{name}.parquet")
+    try:
+        return apply_schema(name, pd.read_parquet(path))
+    except Exception:
+        return None
+
+def archive_year(year):
+    """
+    year의 출석/수업/외부 시트와 현재 이용자 명단을 시트에서 전체 조회해 Parquet(zstd, 열 통계 포함)로 저장.
+    반환: manifest dict. 저장 대기열에 그 연도 행이 남아 있으면 ValueError.
+    """
+    if year >= datetime.now().year:
+        raise ValueError("진행 중인 연도는 보관할 수 없습니다.")
+    names = [year_sheet(kind, year) for kind in YEAR_TABLES]
+    if any(pending_rows(name) for name in names):
+        raise ValueError("시트 저장 대기 중인 출석이 있습니다. 전송이 끝난 뒤 다시 시도해주세요.")
+
     sh = connect_db()
-    ws = get_worksheet(sh, "education_categories")
-    if ws:
-        return pd.DataFrame(ws.get_all_records())
-    return pd.DataFrame()
+    frames = {}
+    for name in names + ["users"]:
+        if not sheet_exists(sh, name):
+            frames[name] = empty_table(name)  # 그 해에 쓰지 않은 시트 (외부수업 없음 등)
+            continue
+        ws = get_worksheet(sh, name)
+        if ws is None:
+            raise RuntimeError(f"워크시트({name})를 열 수 없습니다.")
+        frames[name] = sync_snapshot(ws, name)  # 스냅샷 없이 호출하면 전체 재조회
+    frames[year_sheet("users", year)] = frames.pop("users")
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    manifest = {"year": year, "sealed_at": datetime.now().isoformat(timespec="seconds"), "tables": {}}
+    for name, df in frames.items():
+        path = os.path.join(ARCHIVE_DIR, f"{name}.parquet")
+        df.to_parquet(path + ".tmp", index=False, compression="zstd", write_statistics=True)
+        os.replace(path + ".tmp", path)
+        info = {"rows": len(df)}
+        if "attendance_date" in df.columns and df["attendance_date"].notna().any():
+            info["min_date"] = df["attendance_date"].min().strftime("%Y-%m-%d")
+            info["max_date"] = df["attendance_date"].max().strftime("%Y-%m-%d")
+        manifest["tables"][name] = info
+    with open(_manifest_path(year) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(_manifest_path(year) + ".tmp", _manifest_path(year))
+
+    # 캐시된 해당 연도 테이블은 다음 조회 때 보관본으로 교체
+    cache = get_table_cache()
+    with cache["lock"]:
+        for name in names:
+            if name in cache["tables"]:
+                cache["tables"][name]["loaded_at"] = 0
+    return manifest
+# -----------------------------------------------------------------------------
+# 2-6. 로컬 DB 백엔드 (DB_BACKEND = "sqlite": 워크시트 1개 = SQLite 테이블 1개)
+# -----------------------------------------------------------------------------
+# 앱이 쓰는 gspread 메서드(worksheets, add_worksheet, values_batch_get, get_all_values, batch_get,
+# col_values, append_row(s), update, find, delete_rows)를 같은 모양으로 제공하므로
+# connect_db만 바뀌고 나머지 코드는 그대로입니다. API 한도·지연이 없고 시트 없이도 실행할 수 있습니다.
+# 1행(헤더)은 _worksheets 테이블에, 2행부터는 테이블에 _row(rowid) 순서로 저장 (열 이름 = 헤더).
+LOCAL_INDEX_COLUMNS = ("user_id", "class_id", "attendance_date")
+
+def _sql_name(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _cell_text(value):
+    """시트에 저장될 때와 같은 문자열로 (None -> '', bool -> TRUE/FALSE)"""
+    if value is None:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+def _split_range_name(range_name):
+    """"'attendance_26'!A:A" -> ('attendance_26', 'A:A'), "'users'" -> ('users', None)"""
+    title, sep, a1 = range_name.rpartition("!")
+    if not sep:
+        title, a1 = range_name, None
+    if len(title) > 1 and title[0] == title[-1] == "'":
+        title = title[1:-1].replace("''", "'")
+    return title, a1
+
+class LocalWorksheet:
+    """gspread Worksheet 대용 (시트 행 번호 n >= 2 는 _row 순서로 n - 2 번째 행)"""
+
+    def __init__(self, db, ws_id, title, header, columns):
+        self.db, self.id, self.title = db, ws_id, title
+        self.header = header    # 1행 값 (시트에 보이는 그대로)
+        self.columns = columns  # 같은 위치의 SQLite 열 이름 (헤더가 비었거나 겹치면 _c{열번호})
+        self.table = _sql_name(title)
+
+    # --- 읽기 ---
+    def _select(self, start=0, stop=None, col_start=0, col_stop=None):
+        """데이터 행 [start, stop) x 열 [col_start, col_stop) (0부터, 헤더 제외)"""
+        cols = self.columns[col_start:col_stop]
+        if not cols or (stop is not None and stop <= start):
+            return []
+        sql = f"SELECT {', '.join(map(_sql_name, cols))} FROM {self.table} ORDER BY _row LIMIT ? OFFSET ?"
+        with self.db.lock:
+            return [list(r) for r in self.db.con.execute(sql, (-1 if stop is None else stop - start, start))]
+
+    def get_all_values(self):
+        with self.db.lock:
+            return [list(self.header)] + self._select() if self.header else []
+
+    def get_all_records(self):
+        return [dict(zip(self.header, row)) for row in self._select()]
+
+    def get(self, range_name):
+        """A1 범위 값 ('A:A', '1:1', 'A5:M100' 등)"""
+        grid = gspread.utils.a1_range_to_grid_range(range_name)
+        r0, r1 = grid.get("startRowIndex", 0), grid.get("endRowIndex")
+        c0, c1 = grid.get("startColumnIndex", 0), grid.get("endColumnIndex")
+        with self.db.lock:
+            if not self.header:
+                return []
+            rows = [self.header[c0:c1]] if r0 == 0 and r1 != 0 else []
+            return rows + self._select(max(r0 - 1, 0), None if r1 is None else r1 - 1, c0, c1)
+
+    def batch_get(self, ranges, **kwargs):
+        return [self.get(r) for r in ranges]
+
+    def col_values(self, col):
+        with self.db.lock:
+            if col > len(self.header):
+                return []
+            return [self.header[col - 1]] + [r[0] for r in self._select(0, None, col - 1, col)]
+
+    def to_frame(self):
+        """문자열 DataFrame (values_to_frame(get_all_values())와 같은 결과를 read_sql로 바로)"""
+        with self.db.lock:
+            if not self.header:
+                return pd.DataFrame()
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(map(_sql_name, self.columns))} FROM {self.table} ORDER BY _row", self.db.con
+            )
+            df.columns = list(self.header)
+        return df.loc[:, [c != "" for c in df.columns]]
+
+    def find(self, query, in_column=None):
+        """query와 같은 첫 셀 (행 우선). 없으면 None"""
+        with self.db.lock:
+            cols = range(len(self.header)) if in_column is None else [in_column - 1]
+            for j in cols:
+                if j < len(self.header) and self.header[j] == query:
+                    return gspread.Cell(1, j + 1, query)
+            best = None
+            for j in cols:
+                if j >= len(self.columns):
+                    continue
+                hit = self.db.con.execute(
+                    f"SELECT MIN(_row) FROM {self.table} WHERE {_sql_name(self.columns[j])} = ?", (str(query),)
+                ).fetchone()[0]
+                if hit is not None and (best is None or hit < best[0]):
+                    best = (hit, j)
+            if best is None:
+                return None
+            pos, = self.db.con.execute(f"SELECT COUNT(*) FROM {self.table} WHERE _row <= ?", (best[0],)).fetchone()
+            return gspread.Cell(pos + 1, best[1] + 1, str(query))
+
+    # --- 쓰기 (호출마다 트랜잭션 1개, 시트 사본 동기화를 위해 변경 횟수 증가) ---
+    def _row_ids(self, start, count):
+        return [r for (r,) in self.db.con.execute(
+            f"SELECT _row FROM {self.table} ORDER BY _row LIMIT ? OFFSET ?", (count, start)
+        )]
+
+    def _ensure_width(self, width):
+        """열이 width개가 되도록 이름 없는 열 추가"""
+        while len(self.columns) < width:
+            name = f"_c{len(self.columns) + 1}"
+            self.db.con.execute(f"ALTER TABLE {self.table} ADD COLUMN {_sql_name(name)} TEXT NOT NULL DEFAULT ''")
+            self.header.append("")
+            self.columns.append(name)
+
+    def _set_header(self, values, col_start=0):
+        """헤더 칸 변경 (열 이름도 헤더를 따라 바꾸고 인덱스 대상 열이면 인덱스 생성)"""
+        self._ensure_width(col_start + len(values))
+        for j, value in enumerate(values, start=col_start):
+            self.header[j] = value
+            taken = set(self.columns[:j] + self.columns[j + 1:])
+            name = value if value and not value.startswith("_") and value not in taken else f"_c{j + 1}"
+            if name != self.columns[j]:
+                self.db.con.execute(
+                    f"ALTER TABLE {self.table} RENAME COLUMN {_sql_name(self.columns[j])} TO {_sql_name(name)}"
+                )
+                self.columns[j] = name
+        for col in LOCAL_INDEX_COLUMNS:
+            if col in self.columns:
+                self.db.con.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_sql_name(f'idx_{self.title}_{col}')} ON {self.table} ({_sql_name(col)})"
+                )
+        self._save_meta()
+
+    def _save_meta(self):
+        self.db.con.execute(
+            "UPDATE _worksheets SET header = ?, columns = ? WHERE id = ?",
+            (json.dumps(self.header, ensure_ascii=False), json.dumps(self.columns, ensure_ascii=False), self.id),
+        )
+
+    def _touch(self):
+        self.db.con.execute("UPDATE _worksheets SET changes = changes + 1 WHERE id = ?", (self.id,))
+
+    def _insert(self, rows):
+        """행 추가 (트랜잭션은 호출한 쪽에서). 빈 시트에 추가하는 첫 행은 헤더가 됨 (시트와 동일)"""
+        rows = [[_cell_text(v) for v in row] for row in rows]
+        if not self.header and rows:
+            self._set_header(rows.pop(0))
+        if rows:
+            self._ensure_width(max(len(r) for r in rows))
+            width = len(self.columns)
+            self.db.con.executemany(
+                f"INSERT INTO {self.table} ({', '.join(map(_sql_name, self.columns))}) VALUES ({', '.join('?' * width)})",
+                [(row + [""] * width)[:width] for row in rows],
+            )
+
+    def _reset(self, values):
+        """테이블을 values(첫 행 = 헤더)로 통째로 교체 (트랜잭션은 호출한 쪽에서)"""
+        self.db.con.execute(f"DROP TABLE {self.table}")
+        self.db.con.execute(f"CREATE TABLE {self.table} (_row INTEGER PRIMARY KEY)")
+        self.header, self.columns = [], []
+        self._save_meta()
+        self._insert(values)
+
+    def append_rows(self, rows, **kwargs):
+        with self.db.lock, self.db.con:
+            self._insert(rows)
+            self._touch()
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def update(self, range_name, values=None, **kwargs):
+        """range_name 왼쪽 위 칸부터 values를 덮어씀 (gspread 6의 update(values, range_name) 순서도 허용)"""
+        if not isinstance(range_name, str):
+            range_name, values = values, range_name
+        grid = gspread.utils.a1_range_to_grid_range(range_name)
+        r0, c0 = grid.get("startRowIndex", 0), grid.get("startColumnIndex", 0)
+        values = [[_cell_text(v) for v in row] for row in values]
+        with self.db.lock, self.db.con:
+            if r0 == 0 and values:
+                self._set_header(values[0], c0)
+                values, r0 = values[1:], 1
+            if values:
+                self._ensure_width(c0 + max(len(r) for r in values))
+                count, = self.db.con.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+                for _ in range(count, r0 - 1 + len(values)):  # 마지막 행 아래를 쓰면 빈 행을 채워 넣음
+                    self.db.con.execute(f"INSERT INTO {self.table} DEFAULT VALUES")
+                for row_id, row in zip(self._row_ids(r0 - 1, len(values)), values):
+                    cols = self.columns[c0:c0 + len(row)]
+                    self.db.con.execute(
+                        f"UPDATE {self.table} SET {', '.join(f'{_sql_name(c)} = ?' for c in cols)} WHERE _row = ?",
+                        row + [row_id],
+                    )
+            self._touch()
+
+    def delete_rows(self, start_index, end_index=None):
+        """start_index ~ end_index 행 삭제 (1부터, 끝 포함). 헤더 행은 지울 수 없음"""
+        end_index = end_index or start_index
+        if start_index < 2:
+            raise ValueError("헤더 행은 삭제할 수 없습니다.")
+        with self.db.lock, self.db.con:
+            ids = self._row_ids(start_index - 2, end_index - start_index + 1)
+            self.db.con.executemany(f"DELETE FROM {self.table} WHERE _row = ?", [(i,) for i in ids])
+            self._touch()
+
+class LocalSpreadsheet:
+    """gspread Spreadsheet 대용 (connect_db가 프로세스당 1개 생성, 모든 세션이 연결 1개를 락으로 공유)"""
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.RLock()
+        self.con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        with self.con:
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS _worksheets ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL UNIQUE,"
+                " header TEXT NOT NULL DEFAULT '[]', columns TEXT NOT NULL DEFAULT '[]',"
+                " changes INTEGER NOT NULL DEFAULT 0, mirrored INTEGER NOT NULL DEFAULT 0,"
+                " seeded INTEGER NOT NULL DEFAULT 0)"
+            )
+            # seeded: 시트 내용으로 채웠는지 (이 표시가 생기기 전에 만든 DB는 다음 시작 때 시트와 다시 합침)
+            if "seeded" not in [r[1] for r in self.con.execute("PRAGMA table_info(_worksheets)")]:
+                self.con.execute("ALTER TABLE _worksheets ADD COLUMN seeded INTEGER NOT NULL DEFAULT 0")
+        self._sheets = {}  # 제목 -> LocalWorksheet (같은 시트는 항상 같은 객체)
+
+    def worksheets(self):
+        with self.lock:
+            for ws_id, title, header, columns in self.con.execute(
+                "SELECT id, title, header, columns FROM _worksheets ORDER BY id"
+            ).fetchall():
+                if title not in self._sheets:
+                    self._sheets[title] = LocalWorksheet(self, ws_id, title, json.loads(header), json.loads(columns))
+            return list(self._sheets.values())
+
+    def worksheet(self, title):
+        for ws in self.worksheets():
+            if ws.title == title:
+                return ws
+        raise gspread.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows=100, cols=20, **kwargs):
+        """빈 워크시트(테이블) 생성 - rows/cols는 시트와 호출 모양을 맞추기 위한 값으로 쓰지 않음"""
+        with self.lock, self.con:
+            if self.con.execute("SELECT 1 FROM _worksheets WHERE title = ?", (title,)).fetchone():
+                raise ValueError(f"이미 있는 워크시트입니다: {title}")
+            return self._create(title, seeded=self.is_seeded())
+
+    def _create(self, title, seeded):
+        """워크시트 등록 + 빈 테이블 생성 (트랜잭션은 호출한 쪽에서). 시드가 끝난 DB에서 새로 만든 시트는 바로 사본 대상"""
+        cur = self.con.execute("INSERT INTO _worksheets (title, seeded) VALUES (?, ?)", (title, int(seeded)))
+        self.con.execute(f"CREATE TABLE {_sql_name(title)} (_row INTEGER PRIMARY KEY)")
+        self._sheets[title] = LocalWorksheet(self, cur.lastrowid, title, [], [])
+        return self._sheets[title]
+
+    def is_seeded(self):
+        """시트 내용으로 한 번이라도 채워졌는지 (스프레드시트에는 시트가 항상 1개 이상이므로 시드 성공 시 True)"""
+        with self.lock:
+            return self.con.execute("SELECT 1 FROM _worksheets WHERE seeded = 1 LIMIT 1").fetchone() is not None
+
+    def seed(self, sheets):
+        """
+        {제목: 시트 값(첫 행 = 헤더)}로 로컬 DB를 채우고 모든 워크시트를 seeded로 표시 (트랜잭션 1개).
+        이전 시드가 실패한 동안 로컬에서 쓴 행은 _merge_seed_values로 시트 행과 합치고,
+        합친 결과가 시트와 같은 워크시트는 사본 갱신 대상에서 뺌 (mirrored = changes).
+        """
+        with self.lock, self.con:
+            self.con.execute("UPDATE _worksheets SET seeded = 0")  # 아래 DDL까지 한 트랜잭션으로 묶음
+            known = {ws.title: ws for ws in self.worksheets()}
+            for title, values in sheets.items():
+                ws = known.get(title) or self._create(title, seeded=False)
+                merged = _merge_seed_values(values, ws.get_all_values())
+                ws._reset(merged)
+                ws._touch()
+                if merged == values:
+                    self.con.execute("UPDATE _worksheets SET mirrored = changes WHERE id = ?", (ws.id,))
+            self.con.execute("UPDATE _worksheets SET seeded = 1")
+
+    def values_batch_get(self, ranges, params=None):
+        out = []
+        for range_name in ranges:
+            title, a1 = _split_range_name(range_name)
+            ws = self.worksheet(title)
+            out.append({"range": range_name, "values": ws.get_all_values() if a1 is None else ws.get(a1)})
+        return {"valueRanges": out}
+
+    def query(self, sql, params=()):
+        """집계 쿼리 결과 DataFrame"""
+        with self.lock:
+            return pd.read_sql_query(sql, self.con, params=params)
+
+    def changed_worksheets(self):
+        """시트 사본을 마지막으로 갱신한 뒤 바뀐 (워크시트, 변경 횟수) 목록"""
+        with self.lock:
+            changed = dict(self.con.execute(
+                "SELECT title, changes FROM _worksheets WHERE changes != mirrored AND seeded = 1"
+            ).fetchall())
+            return [(ws, changed[ws.title]) for ws in self.worksheets() if ws.title in changed]
+
+    def mark_mirrored(self, ws, changes):
+        with self.lock, self.con:
+            self.con.execute("UPDATE _worksheets SET mirrored = ? WHERE id = ?", (changes, ws.id))
+
+def _merge_seed_values(remote, local):
+    """
+    시트 값(remote)과 로컬 값(local)을 ID(1열) 기준으로 합침: 같은 ID는 로컬 값, 로컬에만 있는 행은 뒤에.
+    열은 헤더 이름으로 맞추고, 로컬에만 있는 열(submission_token 등)은 오른쪽에 추가합니다.
+    """
+    if len(local) <= 1:
+        return remote
+    if not remote:
+        return local
+    header = list(remote[0]) + [h for h in local[0] if h and h not in remote[0]]
+    width = len(header)
+    merged = [header] + [(list(r) + [""] * width)[:width] for r in remote[1:]]
+    position = {row[0]: i for i, row in enumerate(merged) if i and row[0]}
+    for row in local[1:]:
+        cells = dict(zip(local[0], row))
+        row = [cells.get(h, "") if h else "" for h in header]
+        if row[0] in position:
+            merged[position[row[0]]] = row
+        else:
+            merged.append(row)
+    return merged
+
+def seed_local_db(db):
+    """
+    로컬 DB를 시트 전체 내용으로 채움 (batchGet 1회) - 성공하면 True.
+    시트에 연결할 수 없거나 조회에 실패하면 아무것도 바꾸지 않고 False: connect_db와 시트 사본 스레드가 다시 시도하며,
+    그동안 시트 사본은 갱신하지 않습니다 (거의 빈 로컬 표로 실제 시트를 덮어쓰지 않도록).
+    """
+    sh = connect_sheet()
+    if sh is None:
+        return False
+    try:
+        titles = [ws.title for ws in sh.worksheets()]
+        value_ranges = sh.values_batch_get([gspread.utils.absolute_range_name(t) for t in titles])["valueRanges"]
+    except Exception as e:
+        st.toast(f"⚠️ 구글 시트 내용을 가져오지 못했습니다. 잠시 후 다시 시도합니다: {e}", icon="⏳")
+        return False
+    sheets = {}
+    for title, vr in zip(titles, value_ranges):
+        values = vr.get("values", [])
+        width = max((len(r) for r in values), default=0)
+        sheets[title] = [list(r) + [""] * (width - len(r)) for r in values]
+    db.seed(sheets)
+    return True
+
+# [추가] 시트 사본: 로컬 DB에서 바뀐 워크시트를 주기적으로 구글 시트에 통째로 덮어씀.
+# 사본은 보기용입니다 - 시트에서 직접 고친 내용은 로컬 DB로 돌아오지 않고 다음 갱신 때 덮어써집니다.
+@st.cache_resource
+def get_sheet_mirror():
+    """시트 사본 갱신 스레드 (프로세스당 1개)"""
+    state = {"last_run": None, "last_error": None}
+    state["thread"] = threading.Thread(target=_mirror_worker, args=(state,), daemon=True, name="sheet-mirror")
+    state["thread"].start()
+    return state
+
+def _mirror_worker(state):
+    while True:
+        time.sleep(MIRROR_INTERVAL)
+        try:
+            db = connect_db()
+            if not db.is_seeded() and seed_local_db(db):
+                refresh_tables()  # 시드 전에 읽어 둔 캐시를 시트와 합친 내용으로 다시 맞춤
+            mirror_to_sheet(db)
+            state["last_run"], state["last_error"] = time.time(), None
+        except Exception as e:
+            state["last_error"] = str(e)
+
+def mirror_to_sheet(db):
+    """
+    마지막 갱신 이후 바뀐 워크시트만 시트에 덮어씀.
+    새 값을 먼저 쓰고 새 크기를 넘는 행/열만 잘라내므로, 쓰기가 실패해도 시트가 비지 않습니다.
+    시트 내용으로 시드되기 전에는 갱신하지 않습니다.
+    """
+    if not db.is_seeded():
+        raise RuntimeError("로컬 DB가 아직 시트 내용으로 채워지지 않아 시트 사본을 갱신하지 않습니다.")
+    changed = db.changed_worksheets()
+    if not changed:
+        return
+    sh = connect_sheet()
+    if sh is None:
+        raise RuntimeError("구글 시트에 연결할 수 없습니다.")
+    remote = {ws.title: ws for ws in sh.worksheets()}
+    for ws, changes in changed:
+        values = ws.get_all_values()
+        if not values:
+            continue  # 헤더도 없는 표로 시트를 비우지 않음
+        rows, cols = len(values), len(values[0])
+        target = remote.get(ws.title) or sh.add_worksheet(title=ws.title, rows=rows, cols=cols)
+        if target.row_count < rows or target.col_count < cols:
+            target.resize(rows=max(target.row_count, rows), cols=max(target.col_count, cols))
+        target.update(range_name="A1", values=values)
+        if target.row_count > rows or target.col_count > cols:
+            target.resize(rows=rows, cols=cols)
+        db.mark_mirrored(ws, changes)
+
+def compare_years_sql(db, years, months=None):
+    """
+    compare_years와 같은 결과를 로컬 DB 안에서 집계 (출석 + 수업 조인, 연도당 쿼리 3개).
+    테이블을 DataFrame으로 읽어오지 않습니다. 필요한 열이 없으면 None (pandas 경로로 계산).
+    """
+    summary, trends = [], []
+    for y in years:
+        names = year_sheet("attendance", y), year_sheet("classes", y)
+        if not all(sheet_exists(db, name) for name in names):
+            return None  # 없는 연도 표는 만들지 않고 pandas 경로(빈 표)로 계산
+        att, cls = (get_worksheet(db, name) for name in names)
+        if att is None or cls is None:
+            return None
+        if not {"user_id", "class_id", "attendance_date"} <= set(att.columns) or not {"class_id", "class_name"} <= set(cls.columns):
+            return None
+        # month가 NULL(날짜 없음/형식 오류)이면 stat_keys와 같이 하반기로 셈
+        facts = (
+            "WITH f AS (SELECT a.user_id AS user_id, c.class_name AS class_name,"
+            " CAST(strftime('%m', a.attendance_date) AS INTEGER) AS month"
+            f" FROM {att.table} AS a LEFT JOIN {cls.table} AS c ON c.class_id = a.class_id)"
+            ", g AS (SELECT * FROM f"
+            + (f" WHERE month IN ({', '.join('?' * len(months))})" if months is not None else "")
+            + ") "
+        )
+        params = [int(m) for m in months] if months is not None else []
+        subject = "user_id || char(31) || IFNULL(class_name, char(30))"
+        real, cum, subj, subj_half = db.query(
+            facts + f"SELECT COUNT(DISTINCT user_id), COUNT(*), COUNT(DISTINCT {subject}),"
+            f" COUNT(DISTINCT {subject} || (IFNULL(month, 12) > 6)) FROM g", params
+        ).iloc[0].astype(int)
+        summary.append({"연도": f"{y}년", "실인원": real, "연인원": cum, "과목구분실인원": subj, "과목반기구분실인원": subj_half})
+
+        visits = db.query(facts + "SELECT month, COUNT(*) AS n FROM g WHERE month IS NOT NULL GROUP BY month", params)
+        new_users = db.query(
+            facts + "SELECT first AS month, COUNT(*) AS n FROM (SELECT MIN(month) AS first FROM g GROUP BY user_id)"
+            " WHERE first IS NOT NULL GROUP BY first", params
+        )
+        full = pd.RangeIndex(1, 13)
+        trend = trend_frame(
+            "월", [f"{m}월" for m in full],
+            visits.set_index("month")["n"].reindex(full, fill_value=0).to_numpy(),
+            new_users.set_index("month")["n"].reindex(full, fill_value=0).to_numpy(),
+        )
+        trend.insert(0, "연도", f"{y}년")
+        trends.append(trend)
+    return pd.DataFrame(summary), pd.concat(trends, ignore_index=True)
 # ========== 여기까지 추가 ==========
 
 # ✅ 로컬 이미지 Base64 인코딩 함수 (HTML 삽입용)
@@ -618,6 +2051,37 @@ def get_image_base64(path):
         return f"data:image/png;base64,{encoded}"
     return None
 
+# ✅ 행 ID 생성 함수 (출석 A / 외부수업 EXT / 수업 C / 교육구분 E)
+# 형식: 접두어 + 밀리초 시각(13자리) + 같은 밀리초 내 순번(3자리) + 프로세스 식별자(6자리 hex)
+# - 같은 프로세스에서는 항상 증가하므로 문자열 정렬 = 생성 순서 (기존 'A{초}_{난수}' ID보다 항상 뒤)
+# - 프로세스 식별자로 서버가 여러 개여도 충돌하지 않음
+@st.cache_resource
+def get_id_state():
+    return {"lock": threading.Lock(), "last_ms": 0, "seq": 0, "node": os.urandom(3).hex()}
+
+def new_ids(prefix, n=1):
+    """prefix로 시작하는 시간순 정렬 가능한 고유 ID n개"""
+    state = get_id_state()
+    ids = []
+    with state["lock"]:
+        for _ in range(n):
+            now_ms = int(time.time() * 1000)
+            if now_ms > state["last_ms"]:
+                state["last_ms"], state["seq"] = now_ms, 0
+            else:
+                state["seq"] += 1
+                if state["seq"] > 999:  # 순번을 다 쓰면 다음 밀리초로 넘김 (시계가 뒤로 가도 증가 유지)
+                    state["last_ms"], state["seq"] = state["last_ms"] + 1, 0
+            ids.append(f"{prefix}{state['last_ms']:013d}{state['seq']:03d}{state['node']}")
+    return ids
+
+def new_id(prefix):
+    return new_ids(prefix, 1)[0]
+
+def id_floor(prefix, when):
+    """when(datetime) 이후에 생성된 ID는 모두 이 값보다 크거나 같음 (정렬된 ID 열에서 searchsorted로 기간 조회용)"""
+    return f"{prefix}{int(when.timestamp() * 1000):013d}"
+
 # ✅ 날짜/시간 포맷 자동 변환 함수
 def format_date_input(val):
     nums = "".join(filter(str.isdigit, val))
@@ -636,38 +2100,545 @@ def format_time_input(val):
     if len(nums) == 4:
         return f"{nums[:2]}:{nums[2:]}"
     return val
+
+# [검증 함수] 이용자 관리 폼(1명)과 일괄 등록(열 단위)이 같은 규칙을 씀
+def validate_and_format_birth(val):
+    """생년월일 8자리 숫자만 추출"""
+    nums = "".join(filter(str.isdigit, str(val)))
+    if len(nums) != 8:
+        return None
+    return nums
+
+def validate_and_format_phone(val):
+    """010-XXXX-XXXX 형식으로 변환"""
+    nums = "".join(filter(str.isdigit, str(val)))
+    if len(nums) == 11 and nums.startswith("010"):
+        return f"{nums[:3]}-{nums[3:7]}-{nums[7:]}"
+    return val
+
+def validate_and_format_births(values):
+    """validate_and_format_birth의 열 버전 (8자리가 아니면 NA)"""
+    nums = values.astype(object).fillna("").astype(str).str.replace(r"\D", "", regex=True)
+    return nums.where(nums.str.len() == 8)
+
+def validate_and_format_phones(values):
+    """validate_and_format_phone의 열 버전 (010 휴대폰 번호만 하이픈 형식으로, 나머지는 그대로)"""
+    text = values.astype(object).fillna("").astype(str)
+    nums = text.str.replace(r"\D", "", regex=True)
+    mobile = (nums.str.len() == 11) & nums.str.startswith("010")
+    return text.mask(mobile, nums.str[:3] + "-" + nums.str[3:7] + "-" + nums.str[7:])
 # -----------------------------------------------------------------------------
 # [추가] 4가지 인원 산출 로직 함수
 # -----------------------------------------------------------------------------
+def combine_codes(*codes):
+    """정수 코드 배열 여러 개를 하나의 int64 키로 합침 (혼합 진법, 음수(-1=결측)도 구분)"""
+    key = np.zeros(len(codes[0]) if codes else 0, dtype=np.int64)
+    for code in codes:
+        code = np.asarray(code, dtype=np.int64) + 1
+        key = key * (int(code.max()) + 1 if len(code) else 1) + code
+    return key
+
+def stat_keys(df):
+    """
+    user_id / class_name을 정수 코드로 바꿔 실인원·과목·과목반기 키(int64) 반환.
+    반기는 월 <= 6 이면 상반기(0), 그 외(결측 포함)는 하반기(1)로 기존 규칙과 동일.
+    """
+    user = pd.factorize(df['user_id'])[0]
+    cls = pd.factorize(df['class_name'])[0]
+    half = ~(df['attendance_date'].dt.month <= 6).to_numpy()
+    subject = combine_codes(user, cls)
+    return user, subject, combine_codes(subject, half)
+
 def calculate_stat_metrics(df_target):
     if df_target.empty:
         return 0, 0, 0, 0
 
-    # 데이터 복사 (원본 보존)
-    temp_df = df_target.copy()
-    
-    # 날짜 컬럼이 datetime 형식이 아닐 경우 변환
-    if not pd.api.types.is_datetime64_any_dtype(temp_df['attendance_date']):
-        temp_df['attendance_date'] = pd.to_datetime(temp_df['attendance_date'])
+    # 원본 복사 없이 정수 키만 만들어 고유 건수를 셈 (해시 기반 pd.unique)
+    user, subject, subject_half = stat_keys(df_target)
 
-    # 1. 실인원 (이름/ID 기준 고유 인원)
-    cnt_real = temp_df['user_id'].nunique()
+    # 1. 실인원 (이름/ID 기준 고유 인원, 결측 제외)
+    cnt_real = len(pd.unique(user[user >= 0]))
 
     # 2. 연인원 (단순 출석 횟수 총합)
-    cnt_cumulative = len(temp_df)
+    cnt_cumulative = len(df_target)
 
     # 3. 과목합산 실인원 (이름 + 과목명 고유 건수)
-    # user_id와 class_name이 모두 같은 경우 중복 제거 후 카운트
-    cnt_subject_sum = temp_df[['user_id', 'class_name']].drop_duplicates().shape[0]
+    cnt_subject_sum = len(pd.unique(subject))
 
-    # 4. 과목반기합산 실인원 (이름 + 과목명 + 반기 고유 건수)
-    # 반기 구분 컬럼 생성 (1~6월: 상반기, 7~12월: 하반기)
-    temp_df['half_year'] = temp_df['attendance_date'].dt.month.apply(lambda x: '상반기' if x <= 6 else '하반기')
-    # user_id, class_name, half_year가 모두 같은 경우 중복 제거 후 카운트
-    cnt_subject_period_sum = temp_df[['user_id', 'class_name', 'half_year']].drop_duplicates().shape[0]
+    # 4. 과목반기합산 실인원 (이름 + 과목명 + 반기 고유 건수, 1~6월: 상반기 / 7~12월: 하반기)
+    cnt_subject_period_sum = len(pd.unique(subject_half))
 
     return cnt_real, cnt_cumulative, cnt_subject_sum, cnt_subject_period_sum
 
+# -----------------------------------------------------------------------------
+# [추가] 운영 현황 통계 큐브 (사업구분 × 교육구분 × 장애여부 × 월 × 반기)
+# -----------------------------------------------------------------------------
+# 실인원류(고유 건수)는 칸끼리 더하면 중복이 생기므로, 행마다 "해당 묶음 안에서 처음 나온
+# 조합인지" 표시를 미리 달아 둡니다. 날짜순으로 정렬한 뒤 표시하므로 큐브를 어느 축으로
+# 합쳐도 정확한 고유 건수가 되고, 월 축으로 누적하면 누적 실인원이 됩니다.
+CUBE_DIMS = ["business_category", "education_category", "disability_status", "month", "half"]
+CUBE_LEVELS = {
+    "all": [],
+    "business": ["business_category"],
+    "education": ["education_category"],
+    "disability": ["disability_status"],
+    "goal": ["business_category", "education_category"],
+}
+CUBE_KEYS = ["real", "subject", "subject_half"]
+DISABILITY_TYPES = ["장애", "비장애", "기타"]
+
+def disability_status(is_disabled):
+    """is_disabled(boolean) -> '장애' / '비장애' / '기타'(TRUE/FALSE 외 값, 이용자 정보 없음)"""
+    status = np.where(is_disabled.eq(True).fillna(False).to_numpy(dtype=bool), "장애",
+                      np.where(is_disabled.eq(False).fillna(False).to_numpy(dtype=bool), "비장애", "기타"))
+    return pd.Series(status, index=is_disabled.index, dtype=object)
+
+def build_stat_cube(df):
+    """출석(+수업+이용자) 병합 데이터를 한 번 훑어 큐브 생성 (카테고리 수와 무관하게 groupby 1회)"""
+    flag_cols = [f"{level}_{metric}" for level in CUBE_LEVELS for metric in CUBE_KEYS]
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_DIMS + ["cum"] + flag_cols)
+
+    d = df.sort_values("attendance_date", kind="stable")
+    month = d["attendance_date"].dt.month
+    frame = pd.DataFrame({
+        "business_category": d["business_category"],
+        "education_category": d["education_category"],
+        "disability_status": disability_status(d["is_disabled"]) if "is_disabled" in d else "기타",
+        "month": month,
+        "half": np.where(month <= 6, 1, 2),
+        "user_id": d["user_id"],
+    })
+    # 실인원류 키는 calculate_stat_metrics와 같은 정수 키를 사용 (묶음 코드와 합쳐 1열 duplicated)
+    metric_keys = dict(zip(CUBE_KEYS, stat_keys(d)))
+    dim_codes = {dim: pd.factorize(frame[dim])[0] for dim in CUBE_DIMS}
+    for level, dims in CUBE_LEVELS.items():
+        for metric, key in metric_keys.items():
+            level_key = combine_codes(*[dim_codes[dim] for dim in dims], key)
+            first = ~pd.Series(level_key, index=frame.index).duplicated().to_numpy()
+            if metric == "real":
+                first &= key >= 0  # 실인원은 nunique처럼 user_id 결측 제외
+            frame[f"{level}_{metric}"] = first
+
+    return frame.groupby(CUBE_DIMS, observed=True, dropna=False).agg(
+        cum=("user_id", "size"), **{c: (c, "sum") for c in flag_cols}
+    ).reset_index()
+
+def cube_slice(cube, level):
+    """
+    큐브를 level 묶음으로 합쳐 real(실인원) / cum(연인원) / subject(과목구분) / subject_half(과목반기구분) 반환.
+    level이 'all'이면 Series, 그 외엔 묶음 값을 인덱스로 하는 DataFrame.
+    """
+    cols = {f"{level}_real": "real", "cum": "cum", f"{level}_subject": "subject", f"{level}_subject_half": "subject_half"}
+    dims = CUBE_LEVELS[level]
+    data = cube[dims + list(cols)].rename(columns=cols)
+    if not dims:
+        return data[list(cols.values())].sum().astype(int)
+    data[dims] = data[dims].astype(object)  # 표 순서대로 reindex 하기 위해 일반 문자열로
+    return data.groupby(dims)[list(cols.values())].sum().astype(int)
+
+# [추가] 추이 그래프 집계 단위 (월: 1~12월 고정 / 주·일: 데이터 기간 전체)
+TREND_UNITS = ["월", "주", "일"]
+
+def calculate_trend(df, unit="월"):
+    """
+    추이 그래프용 집계를 한 번의 스캔으로 계산.
+    이용자별 첫 출석 구간을 구해 구간별 신규 인원을 세고 cumsum 하면 누적 실인원이 됩니다.
+    반환 컬럼: [unit, 누적 실인원, 실인원 증가, 누적 연인원, 월별 연인원]
+    """
+    dates = df['attendance_date']
+    if unit == "월":
+        period = dates.dt.month
+        full = pd.RangeIndex(1, 13)
+        labels = [f"{m}월" for m in full]
+    else:
+        period = dates.dt.normalize()
+        if unit == "주":  # 월요일 시작 주
+            period = period - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+        full = pd.date_range(period.min(), period.max(), freq="7D" if unit == "주" else "D") if period.notna().any() else pd.DatetimeIndex([])
+        labels = list(full.strftime("%m/%d~" if unit == "주" else "%m/%d"))
+
+    # 구간별 출석 수 / 이용자별 첫 출석 구간 -> 구간별 신규 인원 (user_id·날짜 결측은 제외)
+    visits = period.value_counts().reindex(full, fill_value=0).to_numpy()
+    first_seen = period.groupby(df['user_id'], observed=True).min()
+    new_users = first_seen.value_counts().reindex(full, fill_value=0).to_numpy()
+    return trend_frame(unit, labels, visits, new_users)
+
+def trend_frame(unit, labels, visits, new_users):
+    """구간별 출석 수 / 신규 인원 배열 -> 추이 그래프 표 (로컬 DB 집계와 같이 씀)"""
+    return pd.DataFrame({
+        unit: labels,
+        "누적 실인원": new_users.cumsum(),
+        "실인원 증가": new_users,
+        "누적 연인원": visits.cumsum(),
+        "월별 연인원": visits,
+    })
+
+# -----------------------------------------------------------------------------
+# [추가] 기간 필터 (월별 / 반기별 / 기간 상세) - 날짜순 정렬된 표를 searchsorted로 잘라냄
+# -----------------------------------------------------------------------------
+HALF_OPTIONS = ["전체", "상반기 (1~6월)", "하반기 (7~12월)"]
+
+def period_filter(year, key=None):
+    """
+    필터 UI를 그리고 (시작, 끝(미포함), 표시 라벨) 반환. 전체 기간이면 (None, None, "전체 기간").
+    우선순위는 기간 상세 > 반기 > 월 (기존과 동일).
+    """
+    fc1, fc2, fc3 = st.columns([1, 1, 2])
+    month_options = ["전체"] + [f"{i}월" for i in range(1, 13)]
+    keys = {k: f"{key}_{k}" if key else None for k in ("month", "half", "range")}
+    sel_month = fc1.selectbox("월별 조회", month_options, key=keys["month"])
+    sel_half = fc2.selectbox("반기별 조회", HALF_OPTIONS, key=keys["half"])
+    range_input = fc3.text_input("기간 상세 조회 (YYMMDD~YYMMDD)", placeholder="예: 240101~240228", key=keys["range"])
+
+    if range_input and '~' in range_input:
+        try:
+            start_s, end_s = range_input.split('~')
+            start_dt = datetime.strptime(start_s.strip(), "%y%m%d")
+            end_dt = datetime.strptime(end_s.strip(), "%y%m%d")
+            return start_dt, end_dt + timedelta(days=1), f"{start_dt.strftime('%Y-%m-%d')} ~ {end_dt.strftime('%Y-%m-%d')}"
+        except ValueError:
+            st.error("기간 형식이 올바르지 않습니다.")
+    elif sel_half == HALF_OPTIONS[1]:
+        return datetime(year, 1, 1), datetime(year, 7, 1), f"{year}년 상반기"
+    elif sel_half == HALF_OPTIONS[2]:
+        return datetime(year, 7, 1), datetime(year + 1, 1, 1), f"{year}년 하반기"
+    elif sel_month != "전체":
+        m = int(sel_month.replace("월", ""))
+        end = datetime(year + 1, 1, 1) if m == 12 else datetime(year, m + 1, 1)
+        return datetime(year, m, 1), end, f"{year}년 {m}월"
+    return None, None, "전체 기간"
+
+def slice_period(df, start, end, col='attendance_date'):
+    """col 기준으로 정렬된 df에서 [start, end) 구간을 이진 탐색으로 잘라 반환 (복사 없는 iloc 슬라이스)"""
+    if start is None or df.empty:
+        return df
+    dates = df[col].to_numpy()
+    lo, hi = np.searchsorted(dates, [np.datetime64(start), np.datetime64(end)], side="left")
+    return df.iloc[lo:hi]
+
+# -----------------------------------------------------------------------------
+# [추가] 운영 현황 병렬 집계 - 서로 독립인 집계를 스레드 풀에서 동시에 계산하고 화면은 메인 스레드에서 그림
+# -----------------------------------------------------------------------------
+# 작업 스레드 안에서는 st.* 를 호출하지 않습니다 (순수 pandas 계산만).
+# 정렬·groupby 등 pandas/numpy 내부 연산은 GIL을 놓고 돌기 때문에 큐브 두 개와 외부 합계가 겹쳐 실행됩니다.
+STATS_WORKERS = 4
+
+@st.cache_resource
+def get_stats_pool():
+    """운영 현황 집계용 스레드 풀 (모든 세션 공용)"""
+    return ThreadPoolExecutor(max_workers=STATS_WORKERS, thread_name_prefix="stats")
+
+def external_totals(df_ext, by):
+    """외부 수업 실인원·연인원 합계를 by 묶음별로 (표 순서대로 reindex 하기 위해 일반 문자열 키로)"""
+    return df_ext.astype({c: object for c in by}).groupby(by)[['external_member', 'external_count']].sum()
+
+# [추가] 기간 누적 실인원 상세 비교 (4-a ~ 4-f) - 이용자 구분 4가지를 열 단위로 한 번에 계산
+DEMOGRAPHIC_CATEGORIES = {
+    "reg_type": ["기존", "신규"],
+    "gender_clean": ["기타", "남", "여"],
+    "disability_status": DISABILITY_TYPES,
+    "age_type": ["학령기", "성인기"],
+}
+DEMOGRAPHIC_DIMS = list(DEMOGRAPHIC_CATEGORIES)
+# 표: (신규여부 조건(None이면 전체), 열 구분, 행 이름, 열 목록)
+DEMOGRAPHIC_TABLES = {
+    "a": (None, "disability_status", "성별", ["장애", "비장애", "기타"]),
+    "b": (None, "age_type", "성별", ["학령기", "성인기"]),
+    "c": ("기존", "disability_status", "성별(기존)", ["장애", "비장애"]),
+    "d": ("기존", "age_type", "성별(기존)", ["학령기", "성인기"]),
+    "e": ("신규", "disability_status", "성별(신규)", ["장애", "비장애"]),
+    "f": ("신규", "age_type", "성별(신규)", ["학령기", "성인기"]),
+}
+
+def encode_demographics(df, year=None):
+    """
+    성별(남/여/기타) / 장애여부 / 생애주기(학령기·성인기) / 신규여부(등록일 연도 == year) 구분 열.
+    신규여부는 등록일에서 숫자만 남겨 앞 4자리를 연도로 봅니다 (2026/01/01, 20260101 등 모두 허용).
+    """
+    year = datetime.now().year if year is None else year
+
+    def flag(col, value):
+        return df[col].eq(value).fillna(False).to_numpy(dtype=bool)
+
+    # 등록일은 겹치는 값이 많으므로 고유값에서만 숫자를 뽑고 코드로 펼침
+    reg_codes, reg_values = pd.factorize(df['registration date'])
+    reg_new = pd.Series(reg_values, dtype=object).astype(str).str.replace(r"\D", "", regex=True).str[:4].eq(str(year)).to_numpy()
+    reg_new = np.append(reg_new, False)[reg_codes]  # 결측(-1)은 '기존'
+    # DEMOGRAPHIC_CATEGORIES 순서대로의 코드 (문자열을 만들지 않고 바로 Categorical)
+    codes = {
+        "reg_type": reg_new.astype(np.int8),
+        "gender_clean": np.select([flag('gender', "남"), flag('gender', "여")], [1, 2], 0),
+        "disability_status": np.select([flag('is_disabled', True), flag('is_disabled', False)], [0, 1], 2),
+        "age_type": np.where(flag('is_school_age', True), 0, 1),
+    }
+    return pd.DataFrame(
+        {dim: pd.Categorical.from_codes(codes[dim], categories=cats) for dim, cats in DEMOGRAPHIC_CATEGORIES.items()},
+        index=df.index,
+    )
+
+def active_user_profile(df):
+    """기간 내 실인원(user_id 기준 중복 제거) + 상세 비교용 구분 컬럼(성별/장애/생애주기/신규여부)"""
+    df_active_users = df.drop_duplicates(subset=['user_id'])
+    return df_active_users.assign(**encode_demographics(df_active_users))
+
+def demographic_crosstabs(profile):
+    """
+    4-a ~ 4-f 표를 {이름: DataFrame}으로 반환.
+    구분 4가지 코드를 하나로 합쳐 bincount 한 번(= 4개 키 groupby)으로 2×3×3×2 건수 배열을 만들고,
+    표마다 필요 없는 축을 합쳐서 씁니다.
+    """
+    shape = [len(cats) for cats in DEMOGRAPHIC_CATEGORIES.values()]
+    flat = np.ravel_multi_index([profile[dim].cat.codes.to_numpy() for dim in DEMOGRAPHIC_DIMS], shape)
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    genders = DEMOGRAPHIC_CATEGORIES["gender_clean"]
+    tables = {}
+    for name, (reg, col, idx_name, cols) in DEMOGRAPHIC_TABLES.items():
+        sub = counts.sum(axis=0) if reg is None else counts[DEMOGRAPHIC_CATEGORIES["reg_type"].index(reg)]
+        # 성별 × col 만 남김 (축 순서: 성별, 장애여부, 생애주기)
+        grid = sub.sum(axis=2 if col == "disability_status" else 1)
+        present = grid.sum(axis=1) > 0  # 해당 인원이 있는 성별만 행으로 (pd.crosstab과 같음)
+        col_pos = [DEMOGRAPHIC_CATEGORIES[col].index(c) for c in cols]
+        ct = pd.DataFrame(grid[present][:, col_pos], columns=cols)
+        ct.insert(0, idx_name, [g for g, p in zip(genders, present) if p])
+        ct['합계'] = ct[cols].sum(axis=1)
+        tables[name] = ct
+    return tables
+
+def submit_stats(df_m, filtered_df, df_ext_merged, filtered_ext_df, trend_unit):
+    """
+    운영 현황 집계를 스레드 풀에 한꺼번에 넘기고 {이름: Future} 반환.
+    화면은 위에서부터 필요한 결과만 .result()로 기다리므로 첫 표는 해당 집계만 끝나면 바로 그려집니다.
+    """
+    pool = get_stats_pool()
+    jobs = {
+        "cube_period": pool.submit(build_stat_cube, filtered_df),
+        "goal_ext": pool.submit(external_totals, filtered_ext_df, ['business_category', 'education_category']),
+        "biz_ext": pool.submit(external_totals, df_ext_merged, ['business_category']),
+        "edu_ext": pool.submit(external_totals, df_ext_merged, ['education_category']),
+        "active_users": pool.submit(active_user_profile, filtered_df),
+        "trend": pool.submit(calculate_trend, df_m, trend_unit),
+    }
+    # 기간 필터가 없으면 연간 큐브 = 기간 큐브 (한 번만 계산)
+    jobs["cube_year"] = jobs["cube_period"] if len(filtered_df) == len(df_m) else pool.submit(build_stat_cube, df_m)
+    return jobs
+
+# -----------------------------------------------------------------------------
+# [추가] 엑셀 내보내기 - 다운로드 버튼을 눌렀을 때만 파일을 만듦 (rerun마다 직렬화하지 않음)
+# -----------------------------------------------------------------------------
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_CHUNK = 5000  # 한 번에 셀 값으로 변환하는 행 수
+SHEET_TITLE_BAD = str.maketrans({c: "_" for c in "[]:*?/\\"})
+
+def sheet_title(name, used):
+    """엑셀 시트 이름 규칙(31자, []:*?/\\ 금지, 중복 불가)에 맞게 정리"""
+    base = str(name).translate(SHEET_TITLE_BAD)[:31] or "Sheet"
+    title, n = base, 1
+    while title.lower() in used:
+        n += 1
+        title = f"{base[:31 - len(str(n)) - 1]}_{n}"
+    used.add(title.lower())
+    return title
+
+def write_workbook(sheets):
+    """
+    {시트 이름: DataFrame} -> xlsx bytes (표마다 시트 하나).
+    openpyxl write-only 모드로 행을 흘려 쓰고, 셀 변환도 EXPORT_CHUNK 행씩 하므로 표가 커도 메모리가 일정합니다.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    used = set()
+    for name, df in sheets.items():
+        ws = wb.create_sheet(title=sheet_title(name, used))
+        ws.append([str(c) for c in df.columns])
+        for start in range(0, len(df), EXPORT_CHUNK):
+            chunk = df.iloc[start:start + EXPORT_CHUNK].astype(object)
+            for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+                ws.append(row)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def excel_download(sheets, file_name, label="📥 엑셀 다운로드", key=None):
+    """
+    클릭할 때 write_workbook을 실행하는 다운로드 버튼. sheets는 DataFrame 하나 또는 {시트 이름: DataFrame}.
+    넘긴 표는 나중에(클릭 시) 읽으므로, 버튼을 만든 뒤 같은 표를 제자리 수정하지 마세요.
+    """
+    if isinstance(sheets, pd.DataFrame):
+        sheets = {os.path.splitext(file_name)[0]: sheets}
+    return st.download_button(
+        label=label,
+        data=lambda: write_workbook(sheets),
+        file_name=file_name,
+        mime=XLSX_MIME,
+        key=key,
+        on_click="ignore",
+    )
+
+# -----------------------------------------------------------------------------
+# [추가] 출석 일괄 가져오기 (CSV/XLSX) - 이름·수업 조회를 열 단위로 한 번에 검증하고 대기열로 저장
+# -----------------------------------------------------------------------------
+# 파일 헤더 -> 내부 컬럼. 이용자는 이용자명 또는 이용자ID(동명이인일 때) 중 하나로 지정합니다.
+ATT_IMPORT_COLUMNS = {
+    "날짜": "attendance_date", "이용자명": "name", "이용자ID": "user_id",
+    "수업명": "class_name", "강사명": "instructor_name", "시간": "attendance_time", "내용": "detail",
+}
+ATT_IMPORT_REQUIRED = ["날짜", "수업명", "시간"]
+
+def read_import_file(name, data):
+    """업로드한 CSV/XLSX를 문자열 표로 읽음 (빈칸은 ''). CSV는 UTF-8 → CP949(엑셀 저장) 순으로 시도"""
+    if name.lower().endswith(".xlsx"):
+        df = pd.read_excel(io.BytesIO(data), dtype=str)
+    else:
+        try:
+            df = pd.read_csv(io.BytesIO(data), dtype=str, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            df = pd.read_csv(io.BytesIO(data), dtype=str, encoding="cp949")
+    df.columns = [str(c).strip() for c in df.columns]
+    # 엑셀 날짜 셀은 '2026-03-02 00:00:00'으로 읽히므로 시각 부분을 떼어 냄
+    return df.fillna("").astype(object).apply(lambda s: s.str.strip().str.replace(r"\s00:00:00$", "", regex=True))
+
+def collect_errors(src, checks):
+    """
+    checks = [(행별 True/False, 사유), ...] 중 처음 걸린 사유를 행마다 골라
+    (오류 여부, 오류 표) 반환. 오류 표의 '행'은 엑셀에서 보이는 행 번호(헤더 = 1행) 입니다.
+    """
+    masks = [pd.Series(m, index=src.index).fillna(False).to_numpy(dtype=bool) for m, _ in checks]
+    reason = pd.Series(np.select(masks, [r for _, r in checks], ""), index=src.index)
+    bad = (reason != "").to_numpy()
+    errors = src[bad].copy()
+    errors.insert(0, "사유", reason[bad])
+    errors.insert(0, "행", src.index[bad] + 2)
+    return bad, errors
+
+def parse_import_dates(values):
+    """날짜 문자열 열 -> datetime (YYYY-MM-DD, YYYYMMDD, YYMMDD, 엑셀 날짜 셀 등). 해석할 수 없으면 NaT"""
+    digits = values.str.replace(r"\s\d{1,2}:\d{2}(:\d{2})?$", "", regex=True).str.replace(r"\D", "", regex=True)
+    long = pd.to_datetime(digits.where(digits.str.len() == 8), format="%Y%m%d", errors="coerce")
+    short = pd.to_datetime(digits.where(digits.str.len() == 6), format="%y%m%d", errors="coerce")
+    return long.fillna(short)
+
+def is_hhmm(text):
+    """'HH:MM' (00:00 ~ 23:59) 형식인지"""
+    hour, sep, minute = text.partition(":")
+    return (sep == ":" and len(hour) == len(minute) == 2 and (hour + minute).isascii()
+            and (hour + minute).isdigit() and int(hour) < 24 and int(minute) < 60)
+
+def normalize_time_range(value):
+    """'1000~1200', '10:00-12:00' -> '10:00 ~ 12:00' (출석 폼과 같은 형식). 두 시각이 모두 HH:MM이 아니면 ''"""
+    parts = [format_time_input(p.strip()) for p in value.replace("-", "~").split("~")]
+    if len(parts) != 2 or not all(is_hhmm(p) for p in parts):
+        return ""
+    return f"{parts[0]} ~ {parts[1]}"
+
+def validate_attendance_import(src, df_u, df_c, df_edu, df_existing, year):
+    """
+    가져올 표를 검증해 (저장할 표, 오류 표) 반환.
+    이용자명 -> user_id, (수업명, 강사명) -> class_id 를 한 번의 매핑으로 찾고
+    날짜 연도 / 외부수업 / 기존 출석·파일 안 중복을 열 단위로 확인합니다.
+    """
+    missing = [c for c in ATT_IMPORT_REQUIRED if c not in src.columns]
+    if "이용자명" not in src.columns and "이용자ID" not in src.columns:
+        missing.append("이용자명 또는 이용자ID")
+    if missing:
+        raise ValueError("필수 열이 없습니다: " + ", ".join(missing))
+    df = src.rename(columns=ATT_IMPORT_COLUMNS).reindex(columns=list(dict.fromkeys(ATT_IMPORT_COLUMNS.values())), fill_value="")
+
+    # 이용자: 이용자ID가 있으면 그대로, 없으면 이름으로 (동명이인은 오류)
+    users = df_u[['user_id', 'name']].astype(object).dropna(subset=['user_id'])
+    name_counts = users['name'].value_counts()
+    by_name = users.drop_duplicates('name').set_index('name')['user_id']
+    known_ids = pd.Index(users['user_id'])
+    user_id = df['user_id'].where(df['user_id'] != "", df['name'].map(by_name).where(df['name'].map(name_counts) == 1))
+    user_bad = ~user_id.isin(known_ids)
+    dup_name = (df['user_id'] == "") & (df['name'].map(name_counts).fillna(0) > 1)
+
+    # 수업: (수업명, 강사명)으로 찾고, 강사명이 비어 있으면 수업명이 하나뿐일 때만 인정
+    cls = df_c[['class_id', 'class_name', 'instructor_name', 'education_category']].astype(object)
+    by_pair = cls.drop_duplicates(['class_name', 'instructor_name']).set_index(['class_name', 'instructor_name'])['class_id']
+    class_counts = cls['class_name'].value_counts()
+    by_class = cls.drop_duplicates('class_name').set_index('class_name')['class_id']
+    class_id = pd.Series(by_pair.reindex(pd.MultiIndex.from_arrays([df['class_name'], df['instructor_name']])).to_numpy(), index=df.index)
+    class_id = class_id.fillna(df['class_name'].map(by_class).where((df['instructor_name'] == "") & (df['class_name'].map(class_counts) == 1)))
+    class_type = cls['education_category'].map(
+        df_edu.astype({'category_name': object}).drop_duplicates('category_name').set_index('category_name')['class_type'].astype(object)
+    ) if not df_edu.empty else pd.Series(index=cls.index, dtype=object)
+    external_ids = pd.Index(cls['class_id'][class_type.to_numpy() == "외부수업"])
+
+    dates = parse_import_dates(df['attendance_date'])
+    time_codes, time_values = pd.factorize(df['attendance_time'])
+    times = pd.Series(np.append([normalize_time_range(v) for v in time_values], "")[time_codes], index=df.index)
+
+    # 기존 출석과 같은 (이용자, 수업, 날짜, 시간)이거나 파일 안에서 반복된 행은 중복
+    def row_keys(uid, cid, day, tm):
+        return uid.astype(object).fillna("").astype(str) + "|" + cid.astype(object).fillna("").astype(str) + "|" + day.dt.strftime("%Y-%m-%d").fillna("") + "|" + tm.astype(object).fillna("").astype(str)
+    keys = row_keys(user_id, class_id, dates, times)
+    existing = pd.Index(row_keys(df_existing['user_id'], df_existing['class_id'], df_existing['attendance_date'], df_existing['attendance_time'])) if len(df_existing) else pd.Index([])
+
+    checks = [
+        (dup_name, "동명이인 - 이용자ID 열로 지정하세요"),
+        (user_bad, "이용자를 찾을 수 없음"),
+        (class_id.isna(), "수업을 찾을 수 없음 (수업명/강사명 확인)"),
+        (class_id.isin(external_ids), "외부수업은 인원수로 등록하세요"),
+        (dates.isna(), "날짜 형식 오류"),
+        (dates.dt.year.ne(year) & dates.notna(), f"{year}년 날짜가 아님"),
+        (times == "", "시간 형식 오류 (예: 10:00 ~ 12:00)"),
+        (keys.isin(existing), "이미 등록된 출석"),
+        (keys.duplicated(), "파일 안에서 중복"),
+    ]
+    bad, errors = collect_errors(src, checks)
+    class_names = cls.drop_duplicates('class_id').set_index('class_id')['class_name']
+    valid = pd.DataFrame({
+        "user_id": user_id, "class_name": class_id.map(class_names), "class_id": class_id,
+        "attendance_date": dates.dt.strftime("%Y-%m-%d"), "attendance_time": times, "detail": df['detail'],
+    })[~bad]
+    return valid, errors
+
+def attendance_import_rows(valid, token):
+    """검증된 표 -> attendance 시트 행 목록 (ID는 한 번에 발급, 토큰은 파일마다 1개)"""
+    ids = new_ids("A", len(valid))
+    cols = ["user_id", "class_name", "class_id", "attendance_date", "attendance_time", "detail"]
+    return [[att_id, *values, token] for att_id, values in zip(ids, valid[cols].itertuples(index=False, name=None))]
+
+# [추가] 이용자 일괄 등록 - 폼과 같은 검증(생년월일 8자리, 010 번호 형식)을 열 단위로
+USER_IMPORT_COLUMNS = {
+    "이름": "name", "생년월일": "birth_date", "최초등록일": "registration date", "성별": "gender",
+    "연락처": "phone", "보호자": "family", "보호자 연락처": "emergency_contact", "주소": "address",
+    "장애": "is_disabled", "수급자": "is_beneficiary", "서울거주": "is_seoul_resident", "학령기": "is_school_age",
+}
+USER_IMPORT_REQUIRED = ["이름", "생년월일", "성별"]
+USER_IMPORT_FLAGS = ["is_disabled", "is_beneficiary", "is_seoul_resident", "is_school_age"]
+FLAG_TRUE_VALUES = ["TRUE", "Y", "YES", "O", "○", "V", "1", "예"]  # 특이사항 열에서 '해당'으로 보는 값 (빈칸 등 나머지는 FALSE)
+
+def validate_user_import(src, existing_ids):
+    """
+    가져올 이용자 표를 검증해 (저장할 표, 오류 표) 반환. user_id = 이름 + 생년월일(폼과 동일).
+    중복은 기존 user_id 해시 인덱스(existing_ids)와 파일 안 반복 둘 다 확인합니다.
+    """
+    missing = [c for c in USER_IMPORT_REQUIRED if c not in src.columns]
+    if missing:
+        raise ValueError("필수 열이 없습니다: " + ", ".join(missing))
+    df = src.rename(columns=USER_IMPORT_COLUMNS).reindex(columns=list(USER_IMPORT_COLUMNS.values()), fill_value="")
+
+    birth = validate_and_format_births(df['birth_date'])
+    user_id = df['name'] + birth.fillna("")
+    bad, errors = collect_errors(src, [
+        (df['name'] == "", "이름 없음"),
+        (birth.isna(), "생년월일은 YYYYMMDD 8자리"),
+        (~df['gender'].isin(["남", "여"]), "성별은 남/여"),
+        (user_id.isin(existing_ids), "이미 등록된 이용자"),
+        (user_id.duplicated(), "파일 안에서 중복"),
+    ])
+    flags = {c: np.where(df[c].str.upper().isin(FLAG_TRUE_VALUES), "TRUE", "FALSE") for c in USER_IMPORT_FLAGS}
+    valid = pd.DataFrame({
+        "user_id": user_id, "name": df['name'], "birth_date": birth, "gender": df['gender'],
+        "phone": validate_and_format_phones(df['phone']),
+        "emergency_contact": validate_and_format_phones(df['emergency_contact']),
+        "address": df['address'], "family": df['family'], "registration date": df['registration date'],
+        **flags,
+    })[~bad]
+    return valid, errors
+
 # -----------------------------------------------------------------------------
 # 3. 메인 로직
 # -----------------------------------------------------------------------------
@@ -808,7 +2779,7 @@ def main():
             st.markdown("<br>" * 13, unsafe_allow_html=True)
             
         # 2025년부터 올해까지의 리스트 생성 (예: [2025, 2026])
-        year_options = list(range(2025, this_year + 1))
+        year_options = dataset_years()
         
         # 기본값을 '올해'로 설정하기 위해 리스트의 마지막 인덱스 계산
         default_idx = len(year_options) - 1
@@ -869,6 +2840,14 @@ def main():
 
     with main_container.container():
 
+        # 저장 후 rerun 되기 전에 남겨둔 알림 표시 (콜백/팝업 공통)
+        if "success_msg" in st.session_state:
+            st.toast(st.session_state["success_msg"], icon="✅")
+            del st.session_state["success_msg"]  # 메시지 한 번 보여줬으면 삭제 (안 그러면 계속 뜸)
+        if "error_msg" in st.session_state:
+            st.toast(st.session_state["error_msg"], icon="⚠️")
+            del st.session_state["error_msg"]
+
         # =========================================================================
         # 0. 메인 페이지 (초기 화면)
         # =========================================================================
@@ -884,62 +2863,8 @@ def main():
                 try:
                     # 날짜 처리 준비
                     today = date.today()
-                    today_birthdays = []    # (이름, 날짜)
-                    upcoming_birthdays = [] # (이름, 날짜, D-Day)
-                    past_birthdays = []     # (이름, 날짜)
-
-                    if not df_u.empty and 'birth_date' in df_u.columns:
-                        for idx, row in df_u.iterrows():
-                            b_str = str(row.get('birth_date', '')).strip()
-                            name = row.get('name', '이름없음')
-                            
-                            # 날짜 파싱 (YYYY/MM/DD 형식에서 숫자만 추출)
-                            b_date = None
-                            try:
-                                nums = "".join(filter(str.isdigit, b_str))
-                                if len(nums) == 8:
-                                    b_date = date(int(nums[:4]), int(nums[4:6]), int(nums[6:]))
-                            except:
-                                continue # 날짜 형식이 올바르지 않으면 패스
-
-                            if b_date:
-                                try:
-                                    # 올해 생일 계산 (올해 연도 + 생일 월/일)
-                                    this_year_bday = date(today.year, b_date.month, b_date.day)
-                                except ValueError:
-                                    # 2월 29일 생일자 등 처리 (올해가 윤년 아니면 28일로)
-                                    this_year_bday = date(today.year, 2, 28)
-
-                                # 날짜 차이 계산
-                                diff = (this_year_bday - today).days
-
-                                # 연말/연초 보정 (예: 오늘 12/31, 생일 1/1 -> 차이는 -364지만 실제론 내년 +1일)
-                                if diff < -300: # 올해 생일이 지났는데 차이가 너무 크면(작년취급) -> 내년 생일로 계산
-                                    try:
-                                        next_bday = date(today.year + 1, b_date.month, b_date.day)
-                                    except:
-                                        next_bday = date(today.year + 1, 2, 28)
-                                    diff = (next_bday - today).days
-                                elif diff > 300: # 내년 생일로 잡혔는데 너무 멀면(내년말) -> 작년 생일로 계산(지난 생일 확인용)
-                                    try:
-                                        prev_bday = date(today.year - 1, b_date.month, b_date.day)
-                                    except:
-                                        prev_bday = date(today.year - 1, 2, 28)
-                                    diff = (prev_bday - today).days
-
-                                # 화면 표시용 날짜 (MM/DD)
-                                bday_display = f"{b_date.month}/{b_date.day}"
-
-                                # 리스트 분류
-                                if diff == 0:
-                                    today_birthdays.append(f"{name} ({bday_display})")
-                                elif 0 < diff <= 14: # 2주 이내 다가오는 생일
-                                    upcoming_birthdays.append(f"{name} ({bday_display}, D-{diff})")
-                                elif -7 <= diff < 0: # 1주 이내 지난 생일
-                                    past_birthdays.append(f"{name} ({bday_display})")
-                    
-                    # 정렬 (다가오는 생일은 D-Day 순, 지난 생일은 최근 순)
-                    upcoming_birthdays.sort(key=lambda x: int(x.split('D-')[1].replace(')', '')))
+                    # 오늘 / 2주 이내 다가오는 생일(D-Day 순) / 1주 이내 지난 생일(최근 순)
+                    today_birthdays, upcoming_birthdays, past_birthdays = find_birthdays(get_birthday_index(), today)
                     finish_loading()
                     st.markdown(f"""
                     <div style='
@@ -1016,6 +2941,7 @@ def main():
         # 1. 이용자 조회
         # =========================================================================
         elif menu == "이용자 조회":
+            prefetch_tables(["users", sheet_att, sheet_cls])
             df_u = get_cached_users()
             df_a = get_cached_attendance(yy)
             df_c = get_cached_classes(yy)
@@ -1028,16 +2954,19 @@ def main():
             st.title("🔍 이용자 조회")
             
             if not df_u.empty:
-                # [수정] 텍스트 입력 후 검색 -> Selectbox 바로 선택 (placeholder 사용)
-                user_opts = [f"{row['name']} ({str(row['user_id'])})" for i, row in df_u.iterrows()]
-                selected_user_str = st.selectbox("이용자를 선택하세요", user_opts, index=None, placeholder="이용자명을 입력하세요")
+                # [수정] 이름 앞글자/초성 검색 -> Selectbox 선택 (옵션 값이 곧 user_id)
+                user_catalog = get_option_catalog("users")
+                sc1, sc2 = st.columns([1, 2])
+                user_query = sc1.text_input("검색 (이름 또는 초성)", placeholder="예: 홍길 / ㅎㄱㄷ", key="user_lookup_query")
+                target_user_id = sc2.selectbox(
+                    "이용자를 선택하세요", search_options(user_catalog, user_query), index=None,
+                    format_func=user_catalog.attrs["labels"].get, placeholder="이용자명을 입력하세요"
+                )
                 
                 finish_loading()
 
-                if selected_user_str:
-                    target_user_id = selected_user_str.split('(')[-1].replace(')', '')
+                if target_user_id:
                             
-                    df_u['user_id'] = df_u['user_id'].astype(str)
                     user_info = df_u[df_u['user_id'] == target_user_id].iloc[0]
                     
                     st.markdown("---")
@@ -1090,48 +3019,17 @@ def main():
                     st.markdown("---")
 
                     if not df_a.empty and not df_c.empty:
-                        df_a['user_id'] = df_a['user_id'].astype(str)
-                        user_attend = df_a[df_a['user_id'] == target_user_id].copy()
+                        user_attend = fact_select(selected_year, 'user_id', target_user_id)
                         
                         if user_attend.empty:
                             st.info("아직 출석 등록이 없습니다.")
                         else:
-                            df_c['class_id'] = df_c['class_id'].astype(str)
-                            user_attend['class_id'] = user_attend['class_id'].astype(str)
-                            merged_df = user_attend.merge(df_c, on='class_id', how='left', suffixes=('', '_info'))
-                            
-                            merged_df['attendance_date'] = pd.to_datetime(merged_df['attendance_date'])
+                            merged_df = user_attend.assign(class_name=user_attend['class_name_att'])  # 출석 당시 수업명
                             merged_df = merged_df.sort_values(by=['attendance_date', 'attendance_time'], ascending=True)
 
                             st.subheader("📋 수강 이력 조회")
-                            fc1, fc2, fc3 = st.columns([1, 1, 2])
-                            
-                            month_options = ["전체"] + [f"{i}월" for i in range(1, 13)]
-                            sel_month = fc1.selectbox("월별 조회", month_options)
-                            sel_half = fc2.selectbox("반기별 조회", ["전체", "상반기 (1~6월)", "하반기 (7~12월)"])
-                            
-                            range_input = fc3.text_input("기간 상세 조회 (YYMMDD~YYMMDD)", placeholder="예: 240101~240228")
-                            
-                            filtered_df = merged_df.copy()
-                            
-                            if range_input and '~' in range_input:
-                                try:
-                                    start_s, end_s = range_input.split('~')
-                                    start_dt = datetime.strptime(start_s.strip(), "%y%m%d")
-                                    end_dt = datetime.strptime(end_s.strip(), "%y%m%d")
-                                    filtered_df = filtered_df[
-                                        (filtered_df['attendance_date'] >= start_dt) & 
-                                        (filtered_df['attendance_date'] <= end_dt)
-                                    ]
-                                except:
-                                    st.error("기간 형식이 올바르지 않습니다.")
-                            elif sel_half == "상반기 (1~6월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(1, 7))]
-                            elif sel_half == "하반기 (7~12월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(7, 13))]
-                            elif sel_month != "전체":
-                                target_month = int(sel_month.replace("월", ""))
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month == target_month]
+                            p_start, p_end, _ = period_filter(selected_year)
+                            filtered_df = slice_period(merged_df, p_start, p_end)
 
                             # 순서 변경: 날짜, 시간, 사업구분, 교육구분, 수업명, 강사명
                             display_cols = ['attendance_date', 'attendance_time', 'business_category', 'education_category', 'class_name', 'instructor_name']
@@ -1151,26 +3049,17 @@ def main():
                                 display_df['출석 날짜'] = display_df['출석 날짜'].dt.strftime('%Y-%m-%d')
                             
                             st.caption(f"총 {len(display_df)}건의 기록이 있습니다.")
-                            # 엑셀 다운로드 버튼
-                            import io
-                            excel_buffer = io.BytesIO()
-                            display_df.to_excel(excel_buffer, index=False, engine='openpyxl')
-                            excel_buffer.seek(0)
-
+                            # 엑셀 다운로드 버튼 (파일은 클릭 시 생성, 순번 컬럼 없이)
                             rc1, rc2, rc3 = st.columns([2, 5, 1])
                             with rc1:
-                                st.download_button(
-                                    label="📥 엑셀 다운로드",
-                                    data=excel_buffer,
-                                    file_name=f"{user_info['name']}_수강이력.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                )
-                            # 순번(No.) 컬럼 추가
+                                excel_download(display_df, f"{user_info['name']}_수강이력.xlsx")
+                            # 순번(No.) 컬럼 추가 (다운로드용 표는 그대로 두고 새 표로)
+                            display_df = display_df.copy(deep=False)
                             display_df.insert(0, 'No.', range(1, len(display_df) + 1))
 
                             with rc3:
                                 if st.button("새로고침", key="refresh_user_inquiry"):
-                                    st.cache_data.clear()
+                                    refresh_tables()
                                     st.rerun()
                             st.dataframe(
                                 display_df, 
@@ -1196,12 +3085,13 @@ def main():
         # 1-2. 수업 조회 (외부수업/내부수업 분기 처리 적용)
         # =========================================================================
         elif menu == "수업 조회":
-            # 1. 필요한 모든 시트 로드
-            df_u = get_cached_users().astype(str)
-            df_a = get_cached_attendance(yy).astype(str)
-            df_c = get_cached_classes(yy).astype(str)
-            df_edu = get_cached_edu_categories().astype(str)
-            df_ext = get_cached_external(yy).astype(str)
+            # 1. 필요한 모든 시트 로드 (batchGet 1회)
+            prefetch_tables(["users", sheet_att, sheet_cls, "education_categories", sheet_ext])
+            df_u = get_cached_users()
+            df_a = get_cached_attendance(yy)
+            df_c = get_cached_classes(yy)
+            df_edu = get_cached_edu_categories()
+            df_ext = get_cached_external(yy)
         
             finish_loading()
 
@@ -1220,13 +3110,17 @@ def main():
                 # -----------------------------------------------------------------
                 # [A] 수업 검색 및 선택
                 # -----------------------------------------------------------------
-                # [수정] 텍스트 입력 후 검색 -> Selectbox 바로 선택 (placeholder 사용)
-                class_opts = [f"{row['class_name']} - {row['instructor_name']} ({row['class_id']})" for i, row in df_c.iterrows()]
-                selected_class_str = st.selectbox("수업을 선택하세요", class_opts, index=None, placeholder="수업명을 입력하세요")
+                # [수정] 수업명 앞글자/초성 검색 -> Selectbox 선택 (옵션 값이 곧 class_id)
+                class_catalog = get_option_catalog(sheet_cls)
+                sc1, sc2 = st.columns([1, 2])
+                class_query = sc1.text_input("검색 (수업명 또는 초성)", placeholder="예: 점자 / ㅈㅈ", key="class_lookup_query")
+                target_class_id = sc2.selectbox(
+                    "수업을 선택하세요", search_options(class_catalog, class_query), index=None,
+                    format_func=class_catalog.attrs["labels"].get, placeholder="수업명을 입력하세요"
+                )
                 finish_loading()
 
-                if selected_class_str:
-                    target_class_id = selected_class_str.split('(')[-1].replace(')', '')
+                if target_class_id:
                             
                     # 수업 상세 정보 가져오기
                     class_info = df_c[df_c['class_id'] == target_class_id].iloc[0]
@@ -1283,43 +3177,13 @@ def main():
                         if target_ext_df.empty:
                             st.info("등록된 외부 수업 일지가 없습니다.")
                         else:
-                            # 날짜 형변환
-                            target_ext_df['attendance_date'] = pd.to_datetime(target_ext_df['attendance_date'])
                             target_ext_df = target_ext_df.sort_values(by='attendance_date', ascending=True)
                             
                             # 필터링 UI (월별 / 반기별 / 기간별)
-                            fc1, fc2, fc3 = st.columns([1, 1, 2])
-                            month_options = ["전체"] + [f"{i}월" for i in range(1, 13)]
-                            sel_month = fc1.selectbox("월별 조회", month_options)
-                            sel_half = fc2.selectbox("반기별 조회", ["전체", "상반기 (1~6월)", "하반기 (7~12월)"])
-                            range_input = fc3.text_input("기간 상세 조회 (YYMMDD~YYMMDD)", placeholder="예: 240101~240228")
-                            
-                            # 필터링 적용
-                            filtered_df = target_ext_df.copy()
-                            if range_input and '~' in range_input:
-                                try:
-                                    start_s, end_s = range_input.split('~')
-                                    start_dt = datetime.strptime(start_s.strip(), "%y%m%d")
-                                    end_dt = datetime.strptime(end_s.strip(), "%y%m%d")
-                                    filtered_df = filtered_df[
-                                        (filtered_df['attendance_date'] >= start_dt) & 
-                                        (filtered_df['attendance_date'] <= end_dt)
-                                    ]
-                                except:
-                                    st.error("기간 형식이 올바르지 않습니다.")
-                            elif sel_half == "상반기 (1~6월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(1, 7))]
-                            elif sel_half == "하반기 (7~12월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(7, 13))]
-                            elif sel_month != "전체":
-                                target_month = int(sel_month.replace("월", ""))
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month == target_month]
-                            
-                            # 통계 계산 (외부실인원/외부연인원 합계)
-                            # 주의: 문자열로 저장되어 있을 수 있으므로 숫자로 변환
-                            filtered_df['external_member'] = pd.to_numeric(filtered_df['external_member'], errors='coerce').fillna(0)
-                            filtered_df['external_count'] = pd.to_numeric(filtered_df['external_count'], errors='coerce').fillna(0)
+                            p_start, p_end, _ = period_filter(selected_year)
+                            filtered_df = slice_period(target_ext_df, p_start, p_end)
                             
+                            # 통계 계산 (외부실인원/외부연인원 합계 - 로딩 시 이미 정수형)
                             total_mem = filtered_df['external_member'].sum()
                             total_cnt = filtered_df['external_count'].sum()
                             
@@ -1341,21 +3205,13 @@ def main():
                             # 순번(No.) 컬럼을 맨 앞에 추가
                             display_df.insert(0, 'No.', range(1, len(display_df) + 1))
                                 
-                            # 엑셀 다운로드
-                            import io
-                            excel_buffer = io.BytesIO()
-                            display_df.to_excel(excel_buffer, index=False, engine='openpyxl')
+                            # 엑셀 다운로드 (파일은 클릭 시 생성)
                             rc1, rc2, rc3 = st.columns([2, 5, 1])
                             with rc1:
-                                st.download_button(
-                                    label="📥 엑셀 다운로드",
-                                    data=excel_buffer.getvalue(),
-                                    file_name=f"{class_info['class_name']}_외부일지.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                )
+                                excel_download(display_df, f"{class_info['class_name']}_외부일지.xlsx")
                             with rc3:
                                 if st.button("새로고침", key="refresh_class_inquiry_ext"):
-                                    st.cache_data.clear()
+                                    refresh_tables()
                                     st.rerun()
                                 
                             st.dataframe(
@@ -1376,44 +3232,17 @@ def main():
                     else:
                         st.subheader("📋 수강 내역 조회")
                         
-                        class_attend = df_a[df_a['class_id'] == target_class_id].copy()
+                        class_attend = fact_select(selected_year, 'class_id', target_class_id)
 
                         if class_attend.empty:
                             st.info("아직 출석 등록이 없습니다.")
                         else:
-                            merged_df = class_attend.merge(df_u, on='user_id', how='left')
-                            merged_df['class_name'] = class_info['class_name'] # 통계 함수용
-                            
-                            merged_df['attendance_date'] = pd.to_datetime(merged_df['attendance_date'])
+                            merged_df = class_attend.assign(class_name=class_info['class_name']) # 통계 함수용
                             merged_df = merged_df.sort_values(by=['attendance_date', 'attendance_time'], ascending=True)
 
                             # 필터링 UI (월별 / 반기별 / 기간별)
-                            fc1, fc2, fc3 = st.columns([1, 1, 2])
-                            month_options = ["전체"] + [f"{i}월" for i in range(1, 13)]
-                            sel_month = fc1.selectbox("월별 조회", month_options)
-                            sel_half = fc2.selectbox("반기별 조회", ["전체", "상반기 (1~6월)", "하반기 (7~12월)"])
-                            range_input = fc3.text_input("기간 상세 조회 (YYMMDD~YYMMDD)", placeholder="예: 240101~240228")
-
-                            filtered_df = merged_df.copy()
-
-                            if range_input and '~' in range_input:
-                                try:
-                                    start_s, end_s = range_input.split('~')
-                                    start_dt = datetime.strptime(start_s.strip(), "%y%m%d")
-                                    end_dt = datetime.strptime(end_s.strip(), "%y%m%d")
-                                    filtered_df = filtered_df[
-                                        (filtered_df['attendance_date'] >= start_dt) & 
-                                        (filtered_df['attendance_date'] <= end_dt)
-                                    ]
-                                except:
-                                    st.error("기간 형식이 올바르지 않습니다.")
-                            elif sel_half == "상반기 (1~6월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(1, 7))]
-                            elif sel_half == "하반기 (7~12월)":
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(7, 13))]
-                            elif sel_month != "전체":
-                                target_month = int(sel_month.replace("월", ""))
-                                filtered_df = filtered_df[filtered_df['attendance_date'].dt.month == target_month]
+                            p_start, p_end, _ = period_filter(selected_year)
+                            filtered_df = slice_period(merged_df, p_start, p_end)
 
                             # 4가지 인원 통계 (함수 활용)
                             c_real, c_cum, c_sub, c_sub_per = calculate_stat_metrics(filtered_df)
@@ -1467,21 +3296,13 @@ def main():
                             if '출석 날짜' in display_df.columns:
                                 display_df['출석 날짜'] = display_df['출석 날짜'].dt.strftime('%Y-%m-%d')
 
-                            # 엑셀 다운로드
-                            import io
-                            excel_buffer = io.BytesIO()
-                            display_df.to_excel(excel_buffer, index=False, engine='openpyxl')
+                            # 엑셀 다운로드 (파일은 클릭 시 생성)
                             rc1, rc2, rc3 = st.columns([2, 5, 1])
                             with rc1:
-                                st.download_button(
-                                    label="📥 엑셀 다운로드",
-                                    data=excel_buffer.getvalue(),
-                                    file_name=f"{class_info['class_name']}_수강자목록.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                )
+                                excel_download(display_df, f"{class_info['class_name']}_수강자목록.xlsx")
                             with rc3:
                                 if st.button("새로고침", key="refresh_class_inquiry_int"):
-                                    st.cache_data.clear()
+                                    refresh_tables()
                                     st.rerun()
                             st.dataframe(
                                 display_df, 
@@ -1506,6 +3327,11 @@ def main():
         # 2. 출석 등록 (수정됨: 이용자 선택을 form 안으로 이동)
         # =========================================================================
         elif menu == "출석 등록":
+            if is_year_sealed(selected_year):
+                finish_loading()
+                st.info(f"🔒 {selected_year}년은 보관(마감)된 연도입니다. 조회만 가능합니다.")
+                st.stop()
+
             # [초기 설정] Session State
             if "att_cls_key" not in st.session_state:
                 st.session_state.att_cls_key = 0
@@ -1542,10 +3368,21 @@ def main():
                 st.stop()
                 
             st.title("✅ 출석등록")
+            for ws_t, name_t in ((ws_a, sheet_att), (ws_ext, sheet_ext)):
+                ensure_token_column(ws_t, name_t)
+
+            # 시트 전송 대기 중인 출석이 있으면 표시 (등록 화면에는 이미 반영되어 있음)
+            pending_cnt, pending_err = outbox_status()
+            if pending_cnt:
+                msg = f"⏳ 구글 시트 저장 대기 {pending_cnt}건 (자동으로 전송됩니다)"
+                if pending_err:
+                    msg += f" · 최근 오류: {pending_err}"
+                st.caption(msg)
             
-            df_u = pd.DataFrame(ws_u.get_all_records()).astype(str)
-            df_c = pd.DataFrame(ws_c.get_all_records()).astype(str)
-            df_edu = pd.DataFrame(ws_edu.get_all_records()).astype(str)
+            prefetch_tables(["users", sheet_cls, "education_categories", sheet_att, sheet_ext])
+            df_u = get_cached_users()
+            df_c = get_cached_classes(yy)
+            df_edu = get_cached_edu_categories()
 
             finish_loading()
 
@@ -1554,14 +3391,6 @@ def main():
             # ---------------------------------------------------------------------
             
             def render_attendance_ui():
-                if "success_msg" in st.session_state:
-                    st.toast(st.session_state["success_msg"], icon="✅")
-                    del st.session_state["success_msg"]  # 메시지 한 번 보여줬으면 삭제 (안 그러면 계속 뜸)
-                if "error_msg" in st.session_state:
-                    st.toast(st.session_state["error_msg"], icon="⚠️")
-                    del st.session_state["error_msg"]
-
-                
                 if df_u.empty or df_c.empty:
                     st.warning("이용자와 수업을 먼저 등록하세요.")
                     return
@@ -1645,6 +3474,20 @@ def main():
                     
                     save_time_str = f"{final_start} ~ {final_end}"
 
+                    # 폼마다 발급한 제출 토큰 (같은 토큰으로 이미 저장했으면 다시 저장하지 않음)
+                    token = st.session_state.get(f"att_token_{current_key}") or new_id("T")
+
+                    def enqueue_once(sheet_name, new_rows):
+                        if not claim_token(sheet_name, token):
+                            st.session_state["success_msg"] = "이미 등록된 출석입니다. (중복 저장 안 함)"
+                            return False
+                        try:
+                            enqueue_rows(sheet_name, new_rows)
+                        except Exception:
+                            release_token(token)
+                            raise
+                        return True
+
                     # 4. 저장 실행 (분기 처리)
                     if class_type == "외부수업":
                         e_mem = st.session_state.get(f"ext_mem_{current_key}", 0)
@@ -1654,11 +3497,13 @@ def main():
                             st.session_state["error_msg"] = "인원수를 입력해주세요."
                             return
                         
-                        new_ext_id = f"EXT{int(time.time())}"
-                        ws_ext.append_row([
+                        new_ext_id = new_id("EXT")
+                        ext_row = [
                             new_ext_id, real_class_id, sel_class_name, save_date_str, save_time_str, 
-                            int(e_mem), int(e_tot), in_detail
-                        ])
+                            int(e_mem), int(e_tot), in_detail, token
+                        ]
+                        if not enqueue_once(sheet_ext, [ext_row]):
+                            return
                         st.session_state["success_msg"] = f"🚩 외부수업 등록 완료! (실인원 {e_mem}명)"
                         
                     else: # 내부수업
@@ -1668,17 +3513,14 @@ def main():
                             return
                         
                         rows = []
-                        for u_str in sel_usrs:
-                            try:
-                                target_uid = u_str.split('(')[-1].replace(')', '')
-                            except:
-                                target_uid = ""
-                            
+                        att_ids = iter(new_ids("A", len(sel_usrs)))
+                        for target_uid in sel_usrs:  # 옵션 값이 곧 user_id
                             if target_uid:
-                                rows.append([f"A{int(time.time())}_{random.randint(100,999)}", target_uid, sel_class_name, real_class_id, save_date_str, save_time_str, in_detail])
+                                rows.append([next(att_ids), target_uid, sel_class_name, real_class_id, save_date_str, save_time_str, in_detail, token])
                         
                         if rows:
-                            ws_a.append_rows(rows)
+                            if not enqueue_once(sheet_att, rows):
+                                return
                             st.session_state["success_msg"] = f"🏠 내부수업 {len(rows)}명 등록 완료!"
                             # 저장 성공 시 선택 값 초기화 (Session State로 관리하는 Class 키만 변경해서 폼 리셋 유도)
                             st.session_state.att_cls_val = [] 
@@ -1718,12 +3560,13 @@ def main():
                     # === [내부수업일 때: 이용자 선택창] ===
                     if class_type == "내부수업":
                         
-                        user_opts = [f"{r['name']} ({str(r['user_id'])})" for i, r in df_u.iterrows()]
+                        user_catalog = get_option_catalog("users")
                         
                         # ⭐ st.multiselect가 form 안에 있으므로 선택해도 새로고침 되지 않음
                         sel_users = st.multiselect(
                             "이용자명 (복수 선택 가능)", 
-                            options=user_opts,
+                            options=user_catalog["id"].tolist(),
+                            format_func=user_catalog.attrs["labels"].get,
                             placeholder="예: 홍길동",
                             key=f"attendance_user_select_{st.session_state.att_cls_key}"
                         )
@@ -1750,11 +3593,61 @@ def main():
                     
                     # === [등록 버튼] ===
                     # [수정] 콜백 함수로 등록 시 리로드를 1번으로 단축
+                    # 폼을 그릴 때 제출 토큰 발급 (저장에 성공해 폼 키가 바뀌면 새 토큰)
+                    st.session_state.setdefault(f"att_token_{st.session_state.att_cls_key}", new_id("T"))
                     st.form_submit_button("등록하기", type="primary", use_container_width=True, on_click=submit_attendance_callback)
 
             # [실행]
             render_attendance_ui()
 
+            # ---------------------------------------------------------------------
+            # [추가] 출석 일괄 가져오기 (종이 일지 / 다른 기관 기록 이관용, 내부직원만)
+            # ---------------------------------------------------------------------
+            def render_attendance_import():
+                if "att_import_key" not in st.session_state:
+                    st.session_state.att_import_key = 0
+
+                st.caption("열: " + ", ".join(ATT_IMPORT_COLUMNS) + " (이용자명·이용자ID 중 하나, 강사명은 같은 수업명이 여러 개일 때 필요)")
+                excel_download(pd.DataFrame(columns=list(ATT_IMPORT_COLUMNS)), "출석_가져오기_양식.xlsx", label="📄 양식 다운로드", key="att_import_template")
+                up = st.file_uploader("출석 파일", type=["csv", "xlsx"], key=f"att_import_file_{st.session_state.att_import_key}", label_visibility="collapsed")
+                if up is None:
+                    return
+
+                data = up.getvalue()
+                try:
+                    src = read_import_file(up.name, data)
+                    valid, errors = validate_attendance_import(src, df_u, df_c, df_edu, load_table(sheet_att), selected_year)
+                except Exception as e:
+                    st.error(f"파일을 읽을 수 없습니다: {e}")
+                    return
+
+                st.markdown(f"전체 **{len(src):,}행** · 등록 가능 **{len(valid):,}행** · 오류 **{len(errors):,}행**")
+                if len(errors):
+                    st.dataframe(errors, use_container_width=True, hide_index=True, height=240)
+                    excel_download(errors, "출석_가져오기_오류.xlsx", label="📥 오류 행 엑셀 다운로드", key="att_import_errors")
+                if valid.empty:
+                    return
+                st.dataframe(valid.head(20), use_container_width=True, hide_index=True)
+
+                if st.button(f"{len(valid):,}건 가져오기", type="primary", key="att_import_btn"):
+                    # 같은 파일을 다시 올려도 한 번만 저장되도록 파일 내용으로 토큰을 만듦
+                    token = "F" + hashlib.sha1(data).hexdigest()[:20]
+                    if not claim_token(sheet_att, token):
+                        st.session_state["error_msg"] = "이미 가져온 파일입니다. (중복 저장 안 함)"
+                    else:
+                        try:
+                            enqueue_rows(sheet_att, attendance_import_rows(valid, token))
+                        except Exception:
+                            release_token(token)
+                            raise
+                        st.session_state["success_msg"] = f"📂 출석 {len(valid):,}건 가져오기 완료! (시트에는 순서대로 전송됩니다)"
+                        st.session_state.att_import_key += 1
+                    st.rerun()
+
+            if st.session_state['role'] == 'internal':
+                with st.expander("📂 출석 일괄 가져오기 (CSV/XLSX)"):
+                    render_attendance_import()
+
         # =========================================================================
         # 3. 운영 현황 (대대적 개편: 세부 통계, 누적 비교, 그래프 시각화)
         # =========================================================================
@@ -1768,9 +3661,11 @@ def main():
             with col_b:
                 st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True) # 줄맞춤용 spacer
                 if st.button("새로고침", key="refresh_stats_main", use_container_width=True):
-                    st.cache_data.clear()
+                    refresh_tables()
                     st.rerun()
         
+            # 5개 테이블을 batchGet 한 번으로 받아 캐시에 채운 뒤 각각 꺼내 씀
+            prefetch_tables(["users", sheet_cls, sheet_att, sheet_ext, "education_categories"])
             df_u = get_cached_users()
             df_c = get_cached_classes(yy)
             # [복구] 누락된 데이터 로드 코드 복구
@@ -1788,80 +3683,35 @@ def main():
                     #      하지만 replace_file_content는 범위를 지정해서 교체하므로 필요한 부분만 교체)
                     # 여기서는 전체 로직을 다루는 큰 블록을 교체하는 것이 안전함.
 
-                    # (데이터 로딩 및 전처리 부분 생략 - 기존 유지)
-                    df_u['user_id'] = df_u['user_id'].astype(str)
-                    df_a['user_id'] = df_a['user_id'].astype(str)
-                    df_a['class_id'] = df_a['class_id'].astype(str)
-                    df_c['class_id'] = df_c['class_id'].astype(str)
-                    df_a['attendance_date'] = pd.to_datetime(df_a['attendance_date'])
-                    
-                    df_ext['attendance_date'] = pd.to_datetime(df_ext['attendance_date']) # [추가] 날짜 변환
-                    df_ext['external_count'] = pd.to_numeric(df_ext['external_count'], errors='coerce').fillna(0)
-                    df_ext['external_member'] = pd.to_numeric(df_ext['external_member'], errors='coerce').fillna(0)
-                    df_ext['class_id'] = df_ext['class_id'].astype(str)
-                    df_ext_merged = df_ext.merge(df_c[['class_id', 'business_category', 'education_category']], on='class_id', how='left')
+                    # (ID/날짜/인원수 형변환은 로딩 시 TABLE_SCHEMAS로 이미 적용됨)
+                    df_ext_merged = df_ext.merge(df_c[['class_id', 'business_category', 'education_category']], on='class_id', how='left').sort_values('attendance_date', kind='stable')
 
 
                     # 메인 병합 데이터프레임 (출석 + 수업 + 이용자)
                     # [수정] class_name 중복 방지를 위한 suffix 설정
-                    df_m = df_a.merge(df_c, on='class_id', how='left', suffixes=('_att', '')).merge(df_u, on='user_id', how='left')
+                    df_m = get_fact_table(selected_year)
                     
                     # -------------------------------------------------------------
                     # [추가] 필터링 (월별 / 반기별 / 기간 상세)
                     # -------------------------------------------------------------
                     
-                    fc1, fc2, fc3 = st.columns([1, 1, 2])
-                    
-                    month_options = ["전체"] + [f"{i}월" for i in range(1, 13)]
-                    sel_month = fc1.selectbox("월별 조회", month_options, key="stats_month")
-                    sel_half = fc2.selectbox("반기별 조회", ["전체", "상반기 (1~6월)", "하반기 (7~12월)"], key="stats_half")
-                    range_input = fc3.text_input("기간 상세 조회 (YYMMDD~YYMMDD)", placeholder="예: 240101~240228", key="stats_range")
-                    
-                    filtered_df = df_m.copy()
-                    filtered_ext_df = df_ext_merged.copy()
-                    
-                    # 반기 컬럼 미리 생성 (통계용)
-                    filtered_df['half'] = filtered_df['attendance_date'].apply(lambda d: '상반기' if d.month <= 6 else '하반기')
-                    # 외부 데이터도 반기 컬럼 필요하면 생성 (여기서는 필터링 용도로 사용 안하면 생략 가능하나 통일성 위해 생성)
-                    
-                    current_filter_label = "전체 기간"
+                    # 출석(팩트 테이블)은 날짜순으로 정렬되어 있고, 외부 데이터도 날짜순으로 맞춰 같은 구간으로 자름
+                    p_start, p_end, current_filter_label = period_filter(selected_year, key="stats")
+                    filtered_df = slice_period(df_m, p_start, p_end)
+                    filtered_ext_df = slice_period(df_ext_merged, p_start, p_end)
 
-                    if range_input and '~' in range_input:
-                        try:
-                            start_s, end_s = range_input.split('~')
-                            start_dt = datetime.strptime(start_s.strip(), "%y%m%d")
-                            end_dt = datetime.strptime(end_s.strip(), "%y%m%d")
-                            filtered_df = filtered_df[
-                                (filtered_df['attendance_date'] >= start_dt) & 
-                                (filtered_df['attendance_date'] <= end_dt)
-                            ]
-                            filtered_ext_df = filtered_ext_df[
-                                (filtered_ext_df['attendance_date'] >= start_dt) & 
-                                (filtered_ext_df['attendance_date'] <= end_dt)
-                            ]
-                            current_filter_label = f"{start_dt.strftime('%Y-%m-%d')} ~ {end_dt.strftime('%Y-%m-%d')}"
-                        except:
-                            st.error("기간 형식이 올바르지 않습니다.")
-                    elif sel_half == "상반기 (1~6월)":
-                        filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(1, 7))]
-                        filtered_ext_df = filtered_ext_df[filtered_ext_df['attendance_date'].dt.month.isin(range(1, 7))]
-                        current_filter_label = f"{datetime.now().year}년 상반기"
-                    elif sel_half == "하반기 (7~12월)":
-                        filtered_df = filtered_df[filtered_df['attendance_date'].dt.month.isin(range(7, 13))]
-                        filtered_ext_df = filtered_ext_df[filtered_ext_df['attendance_date'].dt.month.isin(range(7, 13))]
-                        current_filter_label = f"{datetime.now().year}년 하반기"
-                    elif sel_month != "전체":
-                        target_month = int(sel_month.replace("월", ""))
-                        filtered_df = filtered_df[filtered_df['attendance_date'].dt.month == target_month]
-                        filtered_ext_df = filtered_ext_df[filtered_ext_df['attendance_date'].dt.month == target_month]
-                        current_filter_label = f"{datetime.now().year}년 {target_month}월"
+                    # 아래 표·그래프용 집계를 스레드 풀에서 동시에 시작 (결과는 쓰는 자리에서 기다림)
+                    trend_unit = st.session_state.get("trend_unit", TREND_UNITS[0])
+                    stat_jobs = submit_stats(df_m, filtered_df, df_ext_merged, filtered_ext_df, trend_unit)
 
                     # -------------------------------------------------------------
                     # [0] 종합 인원 집계
                     # -------------------------------------------------------------
                     st.markdown("---")
                     st.markdown("### 📈 종합 인원 집계")
-                    c_real, c_cum, c_sub, c_sub_per = calculate_stat_metrics(filtered_df)
+                    # 모든 표는 아래 두 큐브의 단면입니다 (기간 필터 적용분 / 연간 전체)
+                    cube_period = stat_jobs["cube_period"].result()
+                    c_real, c_cum, c_sub, c_sub_per = cube_slice(cube_period, "all")
 
                     def style_metric(label, value, sub_text):
                         return f"""
@@ -1879,23 +3729,24 @@ def main():
                     with m3: st.markdown(style_metric("③ 과목구분 실인원", f"{c_sub:,}명", "동일인이라도 수강과목 다르면 따로 집계"), unsafe_allow_html=True)
                     with m4: st.markdown(style_metric("④ 과목반기구분 실인원", f"{c_sub_per:,}명", "수강과목, 기간(반기) 다르면 따로 집계"), unsafe_allow_html=True)
 
+                    # 전체 통계 통합 엑셀 버튼 자리 (아래 표들이 모두 만들어진 뒤 채움)
+                    export_slot = st.empty()
+
                     st.markdown("---")
                     
                     # -------------------------------------------------------------
                     # [추가] 목표 달성 표 (2번과 3번 사이 -> 종합집계 하단)
                     # -------------------------------------------------------------
 
-                    # 엑셀 다운로드용 헬퍼 함수 (import io 필요)
-                    import io
-                    def make_excel_download(df_in, file_label):
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            df_in.to_excel(writer, index=False)
-                        return st.download_button(
+                    # 엑셀 다운로드용 헬퍼 함수 (파일은 클릭 시 생성)
+                    # 표마다 버튼을 두고, 같은 표를 전체 통계 통합 파일의 시트로도 모아 둠
+                    export_sheets = {}
+                    def make_excel_download(df_in, file_label, sheet_name=None):
+                        export_sheets[sheet_name or file_label] = df_in
+                        return excel_download(
+                            df_in,
+                            f"{file_label}_{datetime.now().strftime('%Y%m%d')}.xlsx",
                             label=f"📥 {file_label} 엑셀 다운로드",
-                            data=output.getvalue(),
-                            file_name=f"{file_label}_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                         )
 
                     # -------------------------------------------------------------
@@ -1904,70 +3755,39 @@ def main():
                     st.subheader("🎯 목표 달성 현황")
                     
                     if not df_edu.empty:
-                        goal_rows = []
-                        
-                        # [변경] df_edu에 있는 모든 카테고리를 기준으로 순회 (수업 없어도 표시)
+                        # [변경] df_edu에 있는 모든 카테고리를 기준으로 표시 (수업 없어도 표시)
                         # df_edu 컬럼: category_id, business_category, category_name(-> education_category), class_type, category_goal_num, category_goal_mem
                         
                         # 목표값 컬럼이 없을 수 있으므로 예외처리
                         if 'category_goal_num' not in df_edu.columns: df_edu['category_goal_num'] = 0
                         if 'category_goal_mem' not in df_edu.columns: df_edu['category_goal_mem'] = 0
-                        
-                        # 숫자형 변환
-                        df_edu['category_goal_num'] = pd.to_numeric(df_edu['category_goal_num'], errors='coerce').fillna(0)
-                        df_edu['category_goal_mem'] = pd.to_numeric(df_edu['category_goal_mem'], errors='coerce').fillna(0)
-                        
-                        for i, r in df_edu.iterrows():
-                            b_cat = r['business_category']
-                            e_cat = r['category_name'] # 이게 education_category와 매칭됨
-                            t_cum = int(r['category_goal_num'])
-                            t_real = int(r['category_goal_mem'])
-                            
-                            # 현재 필터링된 데이터에서 해당 카테고리 값 집계
-                            # filtered_df에서 b_cat, e_cat 일치하는 것 찾기
-                            if not filtered_df.empty:
-                                target_rows = filtered_df[
-                                    (filtered_df['business_category'] == b_cat) & 
-                                    (filtered_df['education_category'] == e_cat)
-                                ]
-                                
-                                # 연인원
-                                g_cum = len(target_rows)
-                                # 실인원 (과목반기구분 실인원)
-                                g_real = target_rows[['user_id', 'class_name', 'half']].drop_duplicates().shape[0]
-                            else:
-                                g_cum = 0
-                                g_real = 0
-                            
-                            # [추가] 외부 데이터 반영
-                            ext_cum_val = 0
-                            ext_real_val = 0
-                            
-                            if not filtered_ext_df.empty:
-                                target_ext = filtered_ext_df[
-                                    (filtered_ext_df['business_category'] == b_cat) & 
-                                    (filtered_ext_df['education_category'] == e_cat)
-                                ]
-                                ext_cum_val = target_ext['external_count'].sum()
-                                ext_real_val = target_ext['external_member'].sum()
-                            
-                            g_cum += ext_cum_val
-                            g_real += ext_real_val
-                                
-                            # 달성률
-                            r_cum = (g_cum / t_cum * 100) if t_cum > 0 else 0
-                            r_real = (g_real / t_real * 100) if t_real > 0 else 0
-                            
-                            goal_rows.append({
-                                "사업구분": b_cat,
-                                "교육구분": e_cat,
-                                "목표 연인원": f"{t_cum:,}",
-                                "연인원": f"{g_cum:,}",
-                                "연인원 달성률": f"{r_cum:.1f}%",
-                                "목표 실인원": f"{t_real:,}",
-                                "실인원": f"{g_real:,}",
-                                "실인원 달성률": f"{r_real:.1f}%"
-                            })
+
+                        goal_keys = pd.MultiIndex.from_arrays(
+                            [df_edu['business_category'].astype(object), df_edu['category_name'].astype(object)]
+                        )
+                        # 연인원 / 실인원(과목반기구분 실인원) - 큐브 단면
+                        goal_stats = cube_slice(cube_period, "goal").reindex(goal_keys, fill_value=0)
+                        # [추가] 외부 데이터 반영 (인원수 합계는 그대로 더할 수 있음)
+                        goal_ext = stat_jobs["goal_ext"].result().reindex(goal_keys, fill_value=0)
+                        g_cum = goal_stats['cum'].to_numpy() + goal_ext['external_count'].to_numpy()
+                        g_real = goal_stats['subject_half'].to_numpy() + goal_ext['external_member'].to_numpy()
+                        t_cum = df_edu['category_goal_num'].astype(int).to_numpy()
+                        t_real = df_edu['category_goal_mem'].astype(int).to_numpy()
+
+                        # 달성률
+                        r_cum = np.divide(g_cum * 100, t_cum, out=np.zeros(len(t_cum)), where=t_cum > 0)
+                        r_real = np.divide(g_real * 100, t_real, out=np.zeros(len(t_real)), where=t_real > 0)
+
+                        goal_rows = {
+                            "사업구분": df_edu['business_category'].astype(object).to_numpy(),
+                            "교육구분": df_edu['category_name'].astype(object).to_numpy(),
+                            "목표 연인원": [f"{v:,}" for v in t_cum],
+                            "연인원": [f"{v:,}" for v in g_cum],
+                            "연인원 달성률": [f"{v:.1f}%" for v in r_cum],
+                            "목표 실인원": [f"{v:,}" for v in t_real],
+                            "실인원": [f"{v:,}" for v in g_real],
+                            "실인원 달성률": [f"{v:.1f}%" for v in r_real],
+                        }
                             
                         goal_df = pd.DataFrame(goal_rows)
                         # 컬럼 순서 지정
@@ -1988,7 +3808,7 @@ def main():
                                 "실인원 달성률": st.column_config.TextColumn(width="small")
                             }
                         )
-                        make_excel_download(goal_df, f"목표달성현황_{current_filter_label}")
+                        make_excel_download(goal_df, f"목표달성현황_{current_filter_label}", "목표달성현황")
                     else:
                         st.info("교육 카테고리(education_categories) 설정이 확인되지 않습니다.")
 
@@ -2002,32 +3822,19 @@ def main():
                     # -------------------------------------------------------------
                     st.subheader("1. 사업구분(대분류)별 인원 현황")
                     
-                    biz_stats = []
-                    # 데이터에 있는 사업구분만 추출하거나, 미리 정의된 카테고리 전체를 순회
-                    unique_biz = sorted(df_m['business_category'].dropna().unique())
-                    
-                    # [수정] 1. 사업구분별 현황 로직 교체
-                    biz_stats = []
                     # df_m에 없는 사업구분이라도 외부수업에는 있을 수 있으므로 전체 목록 사용
-                    for biz in BUSINESS_CATEGORIES:
-                        # 1) 내부 데이터 계산
-                        sub_df = df_m[df_m['business_category'] == biz]
-                        r, c, s, sp = calculate_stat_metrics(sub_df)
-                        
-                        # 2) 외부 데이터 계산 (아까 만든 df_ext_merged 활용)
-                        sub_ext = df_ext_merged[df_ext_merged['business_category'] == biz]
-                        ext_r = sub_ext['external_member'].sum() # 외부 실인원 합계
-                        ext_c = sub_ext['external_count'].sum()  # 외부 연인원 합계
-                        
-                        # 데이터가 하나라도 있으면 리스트에 추가 (내부/외부 모두 0이면 제외하고 싶으면 if문 추가 가능)
-                        # 여기서는 0이라도 표시되도록 함
-                        biz_stats.append({
-                            "사업구분": biz, 
-                            "실인원": r + ext_r,       # 내부 + 외부
-                            "연인원": c + ext_c,       # 내부 + 외부
-                            "과목구분실인원": s + ext_r,     # 내부 과목합산 + 외부 실인원(단순합산)
-                            "과목반기구분실인원": sp + ext_r # 내부 과목반기 + 외부 실인원(단순합산)
-                        })
+                    # 1) 내부 데이터: 큐브 단면 / 2) 외부 데이터: 실인원·연인원 합계
+                    cube_year = stat_jobs["cube_year"].result()
+                    biz_int = cube_slice(cube_year, "business").reindex(BUSINESS_CATEGORIES, fill_value=0)
+                    biz_ext = stat_jobs["biz_ext"].result().reindex(BUSINESS_CATEGORIES, fill_value=0)
+                    # 여기서는 0이라도 표시되도록 함
+                    biz_stats = pd.DataFrame({
+                        "사업구분": BUSINESS_CATEGORIES,
+                        "실인원": biz_int['real'] + biz_ext['external_member'],                   # 내부 + 외부
+                        "연인원": biz_int['cum'] + biz_ext['external_count'],                     # 내부 + 외부
+                        "과목구분실인원": biz_int['subject'] + biz_ext['external_member'],        # 내부 과목합산 + 외부 실인원(단순합산)
+                        "과목반기구분실인원": biz_int['subject_half'] + biz_ext['external_member'] # 내부 과목반기 + 외부 실인원(단순합산)
+                    }).reset_index(drop=True)
                     
                     # [수정] 1번 표 출력 (열 넓이 균등 설정)
                     df_biz_stats = pd.DataFrame(biz_stats)
@@ -2043,7 +3850,7 @@ def main():
                             "과목반기구분실인원": st.column_config.Column(width="small")
                         }
                     )
-                    make_excel_download(df_biz_stats, "사업구분별_인원현황")
+                    make_excel_download(df_biz_stats, "사업구분별_인원현황", "1_사업구분별")
                     
                     st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
 
@@ -2052,34 +3859,26 @@ def main():
                     # -------------------------------------------------------------
                     st.subheader("2. 교육구분(중분류)별 인원 현황")
                     
-                    edu_stats = []
-                    unique_edu = sorted(df_m['education_category'].dropna().unique()) # 혹은 education_category 컬럼명 확인
-                    unique_edu_all = df_edu['category_name'].unique() if not df_edu.empty else []
-
-                    for edu in unique_edu_all:
-                        # 1) 내부 데이터 계산
-                        sub_df = df_m[df_m['education_category'] == edu]
-                        r, c, s, sp = calculate_stat_metrics(sub_df)
-                        
-                        # 2) 외부 데이터 계산
-                        sub_ext = df_ext_merged[df_ext_merged['education_category'] == edu]
-                        ext_r = sub_ext['external_member'].sum()
-                        ext_c = sub_ext['external_count'].sum()
-                        
-                        # 상위 사업구분명 찾기 (df_edu에서 조회)
-                        parent_biz = "-"
-                        match_row = df_edu[df_edu['category_name'] == edu]
-                        if not match_row.empty:
-                            parent_biz = match_row.iloc[0]['business_category']
-                        
-                        edu_stats.append({
-                            "사업구분": parent_biz, 
-                            "교육구분": edu, 
-                            "실인원": r + ext_r,       # 합산
-                            "연인원": c + ext_c,       # 합산
-                            "과목구분실인원": s + ext_r,     # 합산
-                            "과목반기구분실인원": sp + ext_r # 합산
-                        })
+                    unique_edu_all = list(df_edu['category_name'].astype(object).unique()) if not df_edu.empty else []
+
+                    # 1) 내부 데이터: 큐브 단면 / 2) 외부 데이터: 합계
+                    edu_int = cube_slice(cube_year, "education").reindex(unique_edu_all, fill_value=0)
+                    edu_ext = stat_jobs["edu_ext"].result().reindex(unique_edu_all, fill_value=0)
+                    # 상위 사업구분명 찾기 (df_edu에서 조회)
+                    parent_biz = (
+                        df_edu.astype({'category_name': object, 'business_category': object})
+                        .drop_duplicates('category_name').set_index('category_name')['business_category']
+                        .reindex(unique_edu_all).fillna("-")
+                    ) if not df_edu.empty else pd.Series(dtype=object)
+
+                    edu_stats = pd.DataFrame({
+                        "사업구분": parent_biz,
+                        "교육구분": unique_edu_all,
+                        "실인원": edu_int['real'] + edu_ext['external_member'],                   # 합산
+                        "연인원": edu_int['cum'] + edu_ext['external_count'],                     # 합산
+                        "과목구분실인원": edu_int['subject'] + edu_ext['external_member'],        # 합산
+                        "과목반기구분실인원": edu_int['subject_half'] + edu_ext['external_member'] # 합산
+                    }).reset_index(drop=True)
                         
                     df_edu_stats = pd.DataFrame(edu_stats)
                     st.dataframe(
@@ -2095,7 +3894,7 @@ def main():
                             "과목반기구분실인원": st.column_config.Column(width="small")
                         }
                     )
-                    make_excel_download(df_edu_stats, "교육구분별_인원현황")
+                    make_excel_download(df_edu_stats, "교육구분별_인원현황", "2_교육구분별")
 
                     st.markdown("<div style='height: 20px;'></div>", unsafe_allow_html=True)
 
@@ -2104,31 +3903,17 @@ def main():
                     # -------------------------------------------------------------
                     st.subheader("3. 장애 유형별 인원 현황")
                     
-                    # 장애 유형 컬럼 생성 (기타 포함 로직)
-                    # 현재는 TRUE/FALSE만 있지만, 추후 확장성을 위해 처리
-                    def get_disability_type(val):
-                        val_str = str(val).strip().upper()
-                        if val_str == "TRUE": return "장애"
-                        elif val_str == "FALSE": return "비장애"
-                        else: return "기타"
-                    
-                    df_m['disability_status'] = df_m['is_disabled'].apply(get_disability_type)
-                    
-                    dis_stats = []
-                    unique_dis = ["장애", "비장애", "기타"] # 순서 고정
-                    
-                    for d_type in unique_dis:
-                        sub_df = df_m[df_m['disability_status'] == d_type]
-                        if sub_df.empty and d_type == "기타": continue # 기타가 없으면 생략 가능
-                        
-                        r, c, s, sp = calculate_stat_metrics(sub_df)
-                        dis_stats.append({
-                            "구분": d_type, "실인원": r, "연인원": c, "과목구분실인원": s, "과목반기구분실인원": sp
-                        })
+                    dis_int = cube_slice(cube_year, "disability").reindex(DISABILITY_TYPES, fill_value=0) # 순서 고정
+                    if dis_int.loc["기타", "cum"] == 0:
+                        dis_int = dis_int.drop(index="기타") # 기타가 없으면 생략
+                    dis_stats = pd.DataFrame({
+                        "구분": dis_int.index, "실인원": dis_int['real'], "연인원": dis_int['cum'],
+                        "과목구분실인원": dis_int['subject'], "과목반기구분실인원": dis_int['subject_half']
+                    }).reset_index(drop=True)
                         
                     df_dis_stats = pd.DataFrame(dis_stats)
                     st.dataframe(df_dis_stats, use_container_width=True, hide_index=True)
-                    make_excel_download(df_dis_stats, "장애유형별_인원현황")
+                    make_excel_download(df_dis_stats, "장애유형별_인원현황", "3_장애유형별")
 
                     st.markdown("---")
 
@@ -2144,97 +3929,41 @@ def main():
                     if filtered_df.empty:
                         st.warning("선택된 기간에 데이터가 없습니다.")
                     else:
-                        # 중복 제거 (실인원 기준)
-                        df_active_users = filtered_df.drop_duplicates(subset=['user_id']).copy()
+                        # 중복 제거 (실인원 기준) + 성별/장애/생애주기/신규여부 구분 (풀에서 미리 계산)
+                        df_active_users = stat_jobs["active_users"].result()
                         
                         st.info(f"📅 **[{current_filter_label}]** 누적 실인원: **{len(df_active_users)}명**")
-                        
-                        # 분석을 위한 전처리
-                        current_year_val = datetime.now().year
 
-                        # 성별
-                        df_active_users['gender_clean'] = df_active_users['gender'].apply(lambda x: x if x in ['남', '여'] else '기타')
-                        
-                        # 장애여부 (위에서 만든 disability_status 사용, 없으면 다시 생성)
-                        if 'disability_status' not in df_active_users.columns:
-                             df_active_users['disability_status'] = df_active_users['is_disabled'].apply(get_disability_type)
-                        
-                        # 학령기여부
-                        def get_age_type(val):
-                            return "학령기" if str(val).upper() == "TRUE" else "성인기"
-                        df_active_users['age_type'] = df_active_users['is_school_age'].apply(get_age_type)
-                        
-                        # 신규/기존 여부
-                        def get_reg_type(reg_date):
-                            try:
-                                # 숫자만 추출해서 연도 확인
-                                nums = "".join(filter(str.isdigit, str(reg_date)))
-                                if len(nums) >= 4:
-                                    year = int(nums[:4])
-                                    return "신규" if year == current_year_val else "기존"
-                            except:
-                                pass
-                            return "기존" 
-                        df_active_users['reg_type'] = df_active_users['registration date'].apply(get_reg_type)
-
-                        # ---------------------------------------------------------
-                        # 4-a ~ 4-f 테이블 생성 함수 (Pivot Table 활용)
-                        # ---------------------------------------------------------
-                        def make_crosstab(index_col, columns_col, index_name, col_name_map):
-                            ct = pd.crosstab(df_active_users[index_col], df_active_users[columns_col])
-                            # 없는 컬럼도 0으로 채워서 보여주기 위해 reindex
-                            for expected_col in col_name_map.keys():
-                                if expected_col not in ct.columns:
-                                    ct[expected_col] = 0
-                            # 컬럼 순서 정렬 및 이름 변경
-                            ct = ct[list(col_name_map.keys())].rename(columns=col_name_map)
-                            # 인덱스 이름 설정
-                            ct.index.name = index_name
-                            # 합계 컬럼 추가
-                            ct['합계'] = ct.sum(axis=1)
-                            return ct.reset_index()
+                        # 4-a ~ 4-f 표 (구분 4가지 groupby 한 번)
+                        ct_tables = demographic_crosstabs(df_active_users)
+                        for ct_name, ct_df in ct_tables.items():
+                            export_sheets[f"4{ct_name}_실인원상세"] = ct_df
 
                         t1, t2 = st.columns(2)
                         
                         with t1:
                             st.markdown("**a. 성별 × 장애유형 (실인원)**")
-                            df_a_tbl = make_crosstab('gender_clean', 'disability_status', '성별', {'장애':'장애', '비장애':'비장애', '기타':'기타'})
+                            df_a_tbl = ct_tables["a"]
                             st.dataframe(df_a_tbl, use_container_width=True, hide_index=True)
 
                         with t2:
                             st.markdown("**b. 성별 × 생애주기 (실인원)**")
-                            df_b_tbl = make_crosstab('gender_clean', 'age_type', '성별', {'학령기':'학령기', '성인기':'성인기'})
+                            df_b_tbl = ct_tables["b"]
                             st.dataframe(df_b_tbl, use_container_width=True, hide_index=True)
 
                         st.markdown("<div style='height: 10px;'></div>", unsafe_allow_html=True)
                         t3, t4 = st.columns(2)
 
-                        # 기존인원 / 신규인원 필터링
-                        df_existing = df_active_users[df_active_users['reg_type'] == '기존']
-                        df_new = df_active_users[df_active_users['reg_type'] == '신규']
-
-                        # 헬퍼 함수 재정의 (df_in 파라미터 추가)
-                        def make_crosstab_sub(df_in, index_col, col_target, idx_name, col_map):
-                            if df_in.empty:
-                                return pd.DataFrame(columns=[idx_name] + list(col_map.values()) + ['합계'])
-                            ct = pd.crosstab(df_in[index_col], df_in[col_target])
-                            for k in col_map.keys():
-                                if k not in ct.columns: ct[k] = 0
-                            ct = ct[list(col_map.keys())].rename(columns=col_map)
-                            ct.index.name = idx_name
-                            ct['합계'] = ct.sum(axis=1)
-                            return ct.reset_index()
-
                         with t3:
                             st.markdown("**c. 기존인원 중 장애/비장애 (실인원)**")
                             # 기존인원은 '성별' 구분 언급이 없으므로, 그냥 전체 합계만 보여주거나 성별로 나누거나 해야 함.
                             # 요청사항: "기존인원 중 장애, 비장애 실인원 구분" -> 표 형태가 모호하므로 '성별'을 행으로 두겠습니다.
-                            df_c_tbl = make_crosstab_sub(df_existing, 'gender_clean', 'disability_status', '성별(기존)', {'장애':'장애', '비장애':'비장애'})
+                            df_c_tbl = ct_tables["c"]
                             st.dataframe(df_c_tbl, use_container_width=True, hide_index=True)
 
                         with t4:
                             st.markdown("**d. 기존인원 중 학령기/성인기 (실인원)**")
-                            df_d_tbl = make_crosstab_sub(df_existing, 'gender_clean', 'age_type', '성별(기존)', {'학령기':'학령기', '성인기':'성인기'})
+                            df_d_tbl = ct_tables["d"]
                             st.dataframe(df_d_tbl, use_container_width=True, hide_index=True)
 
                         st.markdown("<div style='height: 10px;'></div>", unsafe_allow_html=True)
@@ -2242,84 +3971,117 @@ def main():
 
                         with t5:
                             st.markdown("**e. 신규인원 중 장애/비장애 (실인원)**")
-                            df_e_tbl = make_crosstab_sub(df_new, 'gender_clean', 'disability_status', '성별(신규)', {'장애':'장애', '비장애':'비장애'})
+                            df_e_tbl = ct_tables["e"]
                             st.dataframe(df_e_tbl, use_container_width=True, hide_index=True)
 
                         with t6:
                             st.markdown("**f. 신규인원 중 학령기/성인기 (실인원)**")
-                            df_f_tbl = make_crosstab_sub(df_new, 'gender_clean', 'age_type', '성별(신규)', {'학령기':'학령기', '성인기':'성인기'})
+                            df_f_tbl = ct_tables["f"]
                             st.dataframe(df_f_tbl, use_container_width=True, hide_index=True)
 
+                    # 통합 파일: 위 표 전체 + 추이 집계 (표별 시트, 클릭 시 생성)
+                    export_sheets[f"추이_{trend_unit}"] = stat_jobs["trend"].result()
+                    with export_slot:
+                        excel_download(
+                            export_sheets,
+                            f"운영현황_{selected_year}_{current_filter_label}_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                            label="📥 운영 현황 전체 엑셀 다운로드 (표별 시트)",
+                            key="stats_export_all",
+                        )
+
                     st.markdown("---")
 
                     # -------------------------------------------------------------
                     # [그래프 섹션] 5 ~ 8
                     # -------------------------------------------------------------
                     st.subheader("📊 월별 추이 그래프")
-                    
-                    # 그래프용 데이터 집계 (1월 ~ 12월)
-                    monthly_stats = []
-                    
-                    # 누적 계산을 위한 변수
-                    prev_cum_real = 0
-                    
-                    # 1월부터 12월까지 순회
-                    for m in range(1, 13):
-                        # 해당 월까지의 데이터 (누적용)
-                        mask_cum = df_m['attendance_date'].dt.month <= m
-                        df_cum = df_m[mask_cum]
-                        
-                        # 해당 월 단독 데이터 (증가분용)
-                        mask_mon = df_m['attendance_date'].dt.month == m
-                        df_mon = df_m[mask_mon]
-                        
-                        # 5. 월누적 실인원 (Cumulative Real)
-                        cum_real = df_cum['user_id'].nunique() if not df_cum.empty else 0
-                        
-                        # 6. 월별 실인원 증가 (Increase Real) 
-                        # 정의: 전월 대비 누적 실인원 증가량 (순수 신규 유입)
-                        real_increase = cum_real - prev_cum_real
-                        prev_cum_real = cum_real
-                        
-                        # 7. 월누적 연인원 (Cumulative Visits)
-                        cum_visits = len(df_cum)
-                        
-                        # 8. 월별 신규 연인원 증가 (Monthly Visits)
-                        # 정의: 해당 월에 발생한 출석 건수
-                        mon_visits = len(df_mon)
-                        
-                        monthly_stats.append({
-                            "월": f"{m}월",
-                            "누적 실인원": cum_real,
-                            "실인원 증가": real_increase,
-                            "누적 연인원": cum_visits,
-                            "월별 연인원": mon_visits
-                        })
-                    
-                    df_graph = pd.DataFrame(monthly_stats)
-                    
-                    # 그래프 그리기 (2개씩 배치)
-                    g1, g2 = st.columns(2)
-                    with g1:
-                        st.markdown("**5. 월 누적 실인원**")
-                        fig5 = px.bar(df_graph, x="월", y="누적 실인원", text_auto=True, color_discrete_sequence=['#4CAF50'])
-                        st.plotly_chart(fig5, use_container_width=True)
-                        
-                    with g2:
-                        st.markdown("**6. 월별 실인원 증가 (순수 신규 유입)**")
-                        fig6 = px.bar(df_graph, x="월", y="실인원 증가", text_auto=True, color_discrete_sequence=['#81C784'])
-                        st.plotly_chart(fig6, use_container_width=True)
-                        
-                    g3, g4 = st.columns(2)
-                    with g3:
-                        st.markdown("**7. 월 누적 연인원**")
-                        fig7 = px.bar(df_graph, x="월", y="누적 연인원", text_auto=True, color_discrete_sequence=['#2196F3'])
-                        st.plotly_chart(fig7, use_container_width=True)
+
+                    # 집계 단위를 바꾸면 이 조각(fragment)만 다시 그림 (위쪽 표는 재계산하지 않음)
+                    @st.fragment
+                    def trend_section():
+                        # 그래프용 데이터 집계 (기본: 1월 ~ 12월, 주/일 단위 선택 가능)
+                        unit = st.radio("집계 단위", TREND_UNITS, horizontal=True, key="trend_unit")
+                        # 5. 누적 실인원 / 6. 실인원 증가(순수 신규 유입) / 7. 누적 연인원 / 8. 해당 구간 출석 건수
+                        df_graph = stat_jobs["trend"].result() if unit == trend_unit else calculate_trend(df_m, unit)
                         
-                    with g4:
-                        st.markdown("**8. 월별 연인원 (해당 월 출석수)**")
-                        fig8 = px.bar(df_graph, x="월", y="월별 연인원", text_auto=True, color_discrete_sequence=['#64B5F6'])
-                        st.plotly_chart(fig8, use_container_width=True)
+                        # 그래프 그리기 (2개씩 배치)
+                        g1, g2 = st.columns(2)
+                        with g1:
+                            st.markdown("**5. 월 누적 실인원**")
+                            fig5 = px.bar(df_graph, x=unit, y="누적 실인원", text_auto=True, color_discrete_sequence=['#4CAF50'])
+                            st.plotly_chart(fig5, use_container_width=True)
+                            
+                        with g2:
+                            st.markdown("**6. 월별 실인원 증가 (순수 신규 유입)**")
+                            fig6 = px.bar(df_graph, x=unit, y="실인원 증가", text_auto=True, color_discrete_sequence=['#81C784'])
+                            st.plotly_chart(fig6, use_container_width=True)
+                            
+                        g3, g4 = st.columns(2)
+                        with g3:
+                            st.markdown("**7. 월 누적 연인원**")
+                            fig7 = px.bar(df_graph, x=unit, y="누적 연인원", text_auto=True, color_discrete_sequence=['#2196F3'])
+                            st.plotly_chart(fig7, use_container_width=True)
+                            
+                        with g4:
+                            st.markdown("**8. 월별 연인원 (해당 월 출석수)**")
+                            fig8 = px.bar(df_graph, x=unit, y="월별 연인원", text_auto=True, color_discrete_sequence=['#64B5F6'])
+                            st.plotly_chart(fig8, use_container_width=True)
+
+                    trend_section()
+
+                    # -------------------------------------------------------------
+                    # [추가] 연도 비교 (선택한 연도의 시트만 읽음)
+                    # -------------------------------------------------------------
+                    st.markdown("---")
+                    st.subheader("📅 연도 비교")
+                    all_years = dataset_years()
+
+                    # 비교 연도/기간을 바꿔도 이 조각만 다시 그림
+                    @st.fragment
+                    def year_compare_section():
+                        yc1, yc2 = st.columns([2, 1])
+                        cmp_years = yc1.multiselect("비교 연도", all_years, default=all_years[-2:], key="stats_cmp_years")
+                        cmp_range = yc2.selectbox("비교 기간", ["연간 전체", "올해 진행된 달까지"], key="stats_cmp_range")
+
+                        if cmp_years:
+                            cmp_years = sorted(cmp_years)
+                            cmp_months = range(1, datetime.now().month + 1) if cmp_range == "올해 진행된 달까지" else None
+                            df_cmp, df_cmp_trend = compare_years(cmp_years, cmp_months)
+                            st.dataframe(df_cmp, use_container_width=True, hide_index=True)
+
+                            y1, y2 = st.columns(2)
+                            with y1:
+                                st.markdown("**연도별 누적 실인원**")
+                                fig_y1 = px.line(df_cmp_trend, x="월", y="누적 실인원", color="연도", markers=True)
+                                st.plotly_chart(fig_y1, use_container_width=True)
+                            with y2:
+                                st.markdown("**연도별 월 연인원**")
+                                fig_y2 = px.bar(df_cmp_trend, x="월", y="월별 연인원", color="연도", barmode="group")
+                                st.plotly_chart(fig_y2, use_container_width=True)
+
+                    year_compare_section()
+
+                    # [추가] 지난 연도 보관 (마감 후 시트 대신 로컬 보관본에서 조회)
+                    with st.expander("🗄️ 지난 연도 보관 (마감)"):
+                        sealed = [y for y in all_years if is_year_sealed(y)]
+                        if sealed:
+                            st.caption("보관된 연도: " + ", ".join(f"{y}년 ({read_manifest(y).get('sealed_at', '')})" for y in sealed))
+                        open_years = [y for y in all_years if y < datetime.now().year and y not in sealed]
+                        if open_years:
+                            ac1, ac2 = st.columns([2, 1])
+                            arc_year = ac1.selectbox("보관할 연도", open_years, key="archive_year", label_visibility="collapsed")
+                            if ac2.button("보관하기", key="archive_btn", use_container_width=True):
+                                try:
+                                    with st.spinner(f"{arc_year}년 데이터를 보관하는 중..."):
+                                        manifest = archive_year(arc_year)
+                                    rows = sum(t["rows"] for t in manifest["tables"].values())
+                                    st.session_state["success_msg"] = f"🗄️ {arc_year}년 보관 완료 ({rows:,}행)"
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"보관 실패: {e}")
+                            st.caption("보관 후에는 해당 연도의 출석·수업을 수정할 수 없고, 조회는 로컬 파일에서 바로 읽습니다.")
+                        elif not sealed:
+                            st.caption("보관할 수 있는 지난 연도가 없습니다.")
 
                 else:
                     st.info("데이터가 충분하지 않습니다. 이용자, 수업, 출석 데이터를 먼저 등록해주세요.")
@@ -2333,21 +4095,6 @@ def main():
         elif menu == "이용자 관리":
             ws = get_worksheet(sh, "users")
 
-            # [검증 함수 정의] - 이용자 관리 메뉴 안에서만 쓰이므로 여기에 정의
-            def validate_and_format_birth(val):
-                """생년월일 8자리 숫자만 추출"""
-                nums = "".join(filter(str.isdigit, str(val)))
-                if len(nums) != 8:
-                    return None
-                return nums
-
-            def validate_and_format_phone(val):
-                """010-XXXX-XXXX 형식으로 변환"""
-                nums = "".join(filter(str.isdigit, str(val)))
-                if len(nums) == 11 and nums.startswith("010"):
-                    return f"{nums[:3]}-{nums[3:7]}-{nums[7:]}"
-                return val
-            
             # ✅ [추가] 삭제 확인 다이얼로그
             @st.dialog("⚠️ 삭제 확인")
             def confirm_delete(user_id, user_name):
@@ -2360,16 +4107,14 @@ def main():
                 if col1.button("🗑️ 삭제", type="primary", use_container_width=True):
                     try:
                         # 1. 삭제 실행
-                        cell = ws.find(user_id)
-                        ws.delete_rows(cell.row)
+                        ws.delete_rows(find_row(ws, "users", user_id))
+                        table_delete("users", user_id)
                     
                         # 2. 세션 상태에 삭제 완료 플래그 설정
                         st.session_state.delete_success = True
                         st.session_state.deleted_name = user_name
                     
-                        # 3. 캐시 초기화 및 새로고침
-                        st.cache_data.clear()
-                        time.sleep(1)
+                        # 3. 새로고침 (캐시는 위에서 해당 행만 반영됨)
                         st.rerun()
                     except Exception as e:
                         st.error(f"삭제 중 오류가 발생했습니다: {e}")
@@ -2390,12 +4135,47 @@ def main():
                 st.session_state.deleted_name = None
         
             # 1. 데이터 불러오기
-            data_records = ws.get_all_records()
-            df = pd.DataFrame(data_records)
-            df = df.astype(str) # 오류 방지를 위해 문자로 변환
+            df = get_cached_users()
 
             finish_loading()
 
+            # [추가] 이용자 일괄 등록 (새 기수 등록 등) - 검증 후 append_rows로 한 번에 저장
+            with st.expander("📂 이용자 일괄 등록 (CSV/XLSX)"):
+                if "user_import_key" not in st.session_state:
+                    st.session_state.user_import_key = 0
+                st.caption("열: " + ", ".join(USER_IMPORT_COLUMNS) + " (특이사항 열은 TRUE/O/Y/예 이면 해당)")
+                excel_download(pd.DataFrame(columns=list(USER_IMPORT_COLUMNS)), "이용자_등록_양식.xlsx", label="📄 양식 다운로드", key="user_import_template")
+                up = st.file_uploader("이용자 파일", type=["csv", "xlsx"], key=f"user_import_file_{st.session_state.user_import_key}", label_visibility="collapsed")
+                if up is not None:
+                    try:
+                        src = read_import_file(up.name, up.getvalue())
+                        valid, errors = validate_user_import(src, table_ids("users"))
+                    except Exception as e:
+                        st.error(f"파일을 읽을 수 없습니다: {e}")
+                        valid, errors = None, None
+                    if valid is not None:
+                        st.markdown(f"전체 **{len(src):,}명** · 등록 가능 **{len(valid):,}명** · 오류 **{len(errors):,}명**")
+                        if len(errors):
+                            st.dataframe(errors, use_container_width=True, hide_index=True, height=240)
+                            excel_download(errors, "이용자_등록_오류.xlsx", label="📥 오류 행 엑셀 다운로드", key="user_import_errors")
+                        if len(valid):
+                            st.dataframe(valid.head(20), use_container_width=True, hide_index=True)
+                            if st.button(f"{len(valid):,}명 등록하기", type="primary", key="user_import_btn"):
+                                # 시트 헤더 순서대로 행 구성 (헤더에 없는 열은 빈칸)
+                                rows = valid.reindex(columns=list(df.columns)).fillna("").astype(str).values.tolist()
+                                try:
+                                    for start in range(0, len(rows), OUTBOX_CHUNK):
+                                        if start:
+                                            time.sleep(OUTBOX_CHUNK_PAUSE)
+                                        chunk = rows[start:start + OUTBOX_CHUNK]
+                                        ws.append_rows(chunk)
+                                        table_append("users", chunk)
+                                    st.session_state["success_msg"] = f"👥 이용자 {len(rows):,}명 등록 완료!"
+                                    st.session_state.user_import_key += 1
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"등록 중 오류: {e} (이미 저장된 이용자는 다시 올리면 '이미 등록된 이용자'로 건너뜁니다)")
+
             # ---------------------------------------------------------------------
             # [A] 표 선택 감지 및 데이터 매핑
             # ---------------------------------------------------------------------
@@ -2492,14 +4272,13 @@ def main():
                         elif not clean_birth:
                             st.error("⛔ 생년월일은 반드시 'YYYYMMDD' 8자리 숫자로 입력해주세요.")
                         else:
-                            new_id = f"{input_name}{clean_birth}"
-                            ids = [str(x) for x in df['user_id'].tolist()] if not df.empty else []
+                            new_user_id = f"{input_name}{clean_birth}"
                             
-                            if new_id in ids:
+                            if new_user_id in table_ids("users"):
                                 st.toast("이미 등록된 이용자입니다.", icon="⚠️")
                             else:
                                 save_vals = [
-                                    new_id, input_name, clean_birth, input_reg, input_gender, clean_phone,
+                                    new_user_id, input_name, clean_birth, input_reg, input_gender, clean_phone,
                                     clean_emer, input_addr, input_fam,
                                     "TRUE" if chk_disabled else "FALSE",
                                     "TRUE" if chk_beneficiary else "FALSE",
@@ -2507,11 +4286,8 @@ def main():
                                     "TRUE" if chk_school else "FALSE"
                                 ]
                                 ws.append_row(save_vals)
-                                st.toast(f"{input_name}님 등록 완료!", icon="✅")
-                                
-                                # 데이터 갱신을 위해 캐시가 있다면 비움
-                                st.cache_data.clear()
-                                time.sleep(1)
+                                table_append("users", [save_vals])
+                                st.session_state["success_msg"] = f"{input_name}님 등록 완료!"
                                 st.rerun()
 
                 else:
@@ -2529,8 +4305,7 @@ def main():
                             st.error("⛔ 수정 실패: 생년월일 형식을 확인해주세요.")
                         else:
                             try:
-                                cell = ws.find(target_user_id)
-                                row_num = cell.row
+                                row_num = find_row(ws, "users", target_user_id)
                                 
                                 update_vals = [
                                     target_user_id, input_name, clean_birth, input_reg, input_gender, clean_phone,
@@ -2541,10 +4316,9 @@ def main():
                                     "TRUE" if chk_school else "FALSE"
                                 ]
                                 ws.update(f"A{row_num}:M{row_num}", [update_vals])
+                                table_update("users", target_user_id, update_vals)
                                 
-                                st.toast("수정 완료!", icon="✅")
-                                st.cache_data.clear()
-                                time.sleep(1)
+                                st.session_state["success_msg"] = "수정 완료!"
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"수정 중 오류: {e}")
@@ -2572,10 +4346,13 @@ def main():
         # 5. 수업 관리 (수정/삭제 팝업 추가 - 수업 & 교육구분)
         # =========================================================================
         elif menu == "수업 관리":
-            ws_c = get_worksheet(sh, sheet_cls)
+            # 보관(마감)된 연도는 수업 등록/수정/삭제만 막음 (교육구분은 연도와 무관하므로 그대로 관리)
+            class_sealed = is_year_sealed(selected_year)
+            ws_c = None if class_sealed else get_worksheet(sh, sheet_cls)
             ws_edu = get_worksheet(sh, "education_categories")
-            get_worksheet(sh, sheet_att)
-            get_worksheet(sh, sheet_ext)
+            if not class_sealed:
+                get_worksheet(sh, sheet_att)
+                get_worksheet(sh, sheet_ext)
             
             # [팝업 함수 1] 수업 삭제 확인
             @st.dialog("⚠️ 수업 삭제 확인")
@@ -2588,11 +4365,9 @@ def main():
                 # 삭제 버튼 (Primary 스타일을 주되, 빨간색은 CSS로 처리됨을 기대하거나 기본 Primary 색상 사용)
                 if col1.button("🗑️ 삭제", type="primary", use_container_width=True):
                     try:
-                        cell = ws_c.find(c_id)
-                        ws_c.delete_rows(cell.row)
-                        st.toast("수업이 삭제되었습니다.", icon="🗑️")
-                        st.cache_data.clear()
-                        time.sleep(1)
+                        ws_c.delete_rows(find_row(ws_c, sheet_cls, c_id))
+                        table_delete(sheet_cls, c_id)
+                        st.session_state["success_msg"] = "🗑️ 수업이 삭제되었습니다."
                         st.rerun()
                     except Exception as e:
                         st.error(f"오류: {e}")
@@ -2610,11 +4385,9 @@ def main():
                 
                 if col1.button("🗑️ 삭제", type="primary", use_container_width=True):
                     try:
-                        cell = ws_edu.find(cat_id)
-                        ws_edu.delete_rows(cell.row)
-                        st.toast("교육구분이 삭제되었습니다.", icon="🗑️")
-                        st.cache_data.clear()
-                        time.sleep(1)
+                        ws_edu.delete_rows(find_row(ws_edu, "education_categories", cat_id))
+                        table_delete("education_categories", cat_id)
+                        st.session_state["success_msg"] = "🗑️ 교육구분이 삭제되었습니다."
                         st.rerun()
                     except Exception as e:
                         st.error(f"오류: {e}")
@@ -2623,7 +4396,7 @@ def main():
                     st.rerun()
 
             # 시트 로드 확인
-            if ws_c is None or ws_edu is None:
+            if (ws_c is None and not class_sealed) or ws_edu is None:
                 finish_loading()
                 st.error("구글 시트 로드 실패")
                 st.stop()
@@ -2631,11 +4404,9 @@ def main():
             st.title("🏫 수업 관리")
             
             # 데이터 로드
-            data_c = ws_c.get_all_records()
-            data_edu = ws_edu.get_all_records()
-            
-            df_c = pd.DataFrame(data_c).astype(str)
-            df_edu = pd.DataFrame(data_edu).astype(str)
+            prefetch_tables([sheet_cls, "education_categories"])
+            df_c = get_cached_classes(yy)
+            df_edu = get_cached_edu_categories()
 
             finish_loading()
 
@@ -2644,124 +4415,128 @@ def main():
             # ---------------------------------------------------------------------
             st.subheader("➕ 수업 등록 및 관리")
             
-            # 1-1. 수업 표 선택 감지
-            sel_class_idx = None
-            mode_class = "register"
+            if class_sealed:
+                st.info(f"🔒 {selected_year}년은 보관(마감)된 연도입니다. 수업은 조회만 가능합니다.")
+            else:
+                # 1-1. 수업 표 선택 감지
+                sel_class_idx = None
+                mode_class = "register"
             
-            if "class_grid" in st.session_state and st.session_state.class_grid.get("selection", {}).get("rows"):
-                sel_rows = st.session_state.class_grid["selection"]["rows"]
-                if sel_rows:
-                    sel_class_idx = sel_rows[0]
-                    mode_class = "edit"
-
-            # 1-2. 수업 폼 초기값 설정
-            def_c_biz = BUSINESS_CATEGORIES[0]
-            def_c_edu = None
-            def_c_name = ""
-            def_c_inst = ""
-            def_c_date = ""
-            target_class_id = None
-
-            if mode_class == "edit" and sel_class_idx is not None:
-                try:
-                    row_c = df_c.iloc[sel_class_idx]
-                    target_class_id = row_c['class_id']
+                if "class_grid" in st.session_state and st.session_state.class_grid.get("selection", {}).get("rows"):
+                    sel_rows = st.session_state.class_grid["selection"]["rows"]
+                    if sel_rows:
+                        sel_class_idx = sel_rows[0]
+                        mode_class = "edit"
+
+                # 1-2. 수업 폼 초기값 설정
+                def_c_biz = BUSINESS_CATEGORIES[0]
+                def_c_edu = None
+                def_c_name = ""
+                def_c_inst = ""
+                def_c_date = ""
+                target_class_id = None
+
+                if mode_class == "edit" and sel_class_idx is not None:
+                    try:
+                        row_c = df_c.iloc[sel_class_idx]
+                        target_class_id = row_c['class_id']
                     
-                    # 기존 값 매핑
-                    if row_c['business_category'] in BUSINESS_CATEGORIES:
-                        def_c_biz = row_c['business_category']
+                        # 기존 값 매핑
+                        if row_c['business_category'] in BUSINESS_CATEGORIES:
+                            def_c_biz = row_c['business_category']
                     
-                    # 교육구분 임시 저장 (폼 안에서 필터링 후 매칭)
-                    temp_edu_val = row_c['education_category'] 
+                        # 교육구분 임시 저장 (폼 안에서 필터링 후 매칭)
+                        temp_edu_val = row_c['education_category'] 
                     
-                    def_c_name = row_c['class_name']
-                    def_c_inst = row_c['instructor_name']
-                    def_c_date = row_c['start_date']
+                        def_c_name = row_c['class_name']
+                        def_c_inst = row_c['instructor_name']
+                        def_c_date = row_c['start_date']
                     
-                    st.info(f"✏️ 수업 '{def_c_name}'을(를) 수정하거나 삭제할 수 있습니다.")
-                except:
-                    mode_class = "register"
+                        st.info(f"✏️ 수업 '{def_c_name}'을(를) 수정하거나 삭제할 수 있습니다.")
+                    except:
+                        mode_class = "register"
 
-        # ---------------------------------------------------------------------
-            # [수업 관리] 1-3. 수업 입력 폼 (테두리 추가 + 드롭박스 즉시 반응 유지)
             # ---------------------------------------------------------------------
+                # [수업 관리] 1-3. 수업 입력 폼 (테두리 추가 + 드롭박스 즉시 반응 유지)
+                # ---------------------------------------------------------------------
             
-            # ✅ st.container(border=True)가 '폼'처럼 보이는 테두리를 만들어줍니다.
-            # 하지만 st.form과 달리, 내부의 selectbox가 즉시 반응할 수 있습니다!
-            with st.container(border=True):
+                # ✅ st.container(border=True)가 '폼'처럼 보이는 테두리를 만들어줍니다.
+                # 하지만 st.form과 달리, 내부의 selectbox가 즉시 반응할 수 있습니다!
+                with st.container(border=True):
             
-                # (1) 사업구분 (대분류) 선택 - 선택 즉시 화면 리로드 (테두리 안에서도 작동함!)
-                biz_idx = BUSINESS_CATEGORIES.index(def_c_biz) if def_c_biz in BUSINESS_CATEGORIES else 0
-                sel_biz_cat = st.selectbox("1. 사업구분(대분류)", BUSINESS_CATEGORIES, index=biz_idx)
+                    # (1) 사업구분 (대분류) 선택 - 선택 즉시 화면 리로드 (테두리 안에서도 작동함!)
+                    biz_idx = BUSINESS_CATEGORIES.index(def_c_biz) if def_c_biz in BUSINESS_CATEGORIES else 0
+                    sel_biz_cat = st.selectbox("1. 사업구분(대분류)", BUSINESS_CATEGORIES, index=biz_idx)
 
-                # (2) 교육구분 (중분류) 필터링 로직
-                filtered_edu_list = []
-                if not df_edu.empty:
-                    filtered_rows = df_edu[df_edu['business_category'] == sel_biz_cat]
-                    filtered_edu_list = filtered_rows['category_name'].tolist()
-
-                # 수정 모드값 매칭
-                edu_idx = 0
-                if mode_class == "edit" and 'temp_edu_val' in locals():
-                    if temp_edu_val in filtered_edu_list:
-                        edu_idx = filtered_edu_list.index(temp_edu_val)
-
-                # (3) 폼 시작: 중분류 ~ 나머지 입력값
-                with st.form("class_manage_form"):
-                    if not filtered_edu_list:
-                        st.warning(f"⚠️ '{sel_biz_cat}'에 등록된 교육구분이 없습니다.")
-                        sel_edu_cat = st.selectbox("2. 교육구분명(중분류)", ["(없음)"], disabled=True)
-                    else:
-                        sel_edu_cat = st.selectbox("2. 교육구분명(중분류)", filtered_edu_list, index=edu_idx)
+                    # (2) 교육구분 (중분류) 필터링 로직
+                    filtered_edu_list = []
+                    if not df_edu.empty:
+                        filtered_rows = df_edu[df_edu['business_category'] == sel_biz_cat]
+                        filtered_edu_list = filtered_rows['category_name'].tolist()
+
+                    # 수정 모드값 매칭
+                    edu_idx = 0
+                    if mode_class == "edit" and 'temp_edu_val' in locals():
+                        if temp_edu_val in filtered_edu_list:
+                            edu_idx = filtered_edu_list.index(temp_edu_val)
+
+                    # (3) 폼 시작: 중분류 ~ 나머지 입력값
+                    with st.form("class_manage_form"):
+                        if not filtered_edu_list:
+                            st.warning(f"⚠️ '{sel_biz_cat}'에 등록된 교육구분이 없습니다.")
+                            sel_edu_cat = st.selectbox("2. 교육구분명(중분류)", ["(없음)"], disabled=True)
+                        else:
+                            sel_edu_cat = st.selectbox("2. 교육구분명(중분류)", filtered_edu_list, index=edu_idx)
 
-                    c1, c2, c3 = st.columns(3)
-                    input_class_name = c1.text_input("3. 수업명(소분류)", value=def_c_name)
-                    input_instructor = c2.text_input("4. 강사명", value=def_c_inst)                      
-                    input_start_date = c3.text_input("5. 강의 시작일 (예: 20240101)", placeholder="YYYYMMDD", value=def_c_date)
+                        c1, c2, c3 = st.columns(3)
+                        input_class_name = c1.text_input("3. 수업명(소분류)", value=def_c_name)
+                        input_instructor = c2.text_input("4. 강사명", value=def_c_inst)                      
+                        input_start_date = c3.text_input("5. 강의 시작일 (예: 20240101)", placeholder="YYYYMMDD", value=def_c_date)
                     
-                    st.markdown("---")
+                        st.markdown("---")
     
-                    # -----------------------------------------------------------------
-                    # [버튼 로직] 폼 내부 버튼 (form_submit_button)
-                    # -----------------------------------------------------------------
-                    if mode_class == "register":
-                        # 신규 등록
+                        # -----------------------------------------------------------------
+                        # [버튼 로직] 폼 내부 버튼 (form_submit_button)
+                        # -----------------------------------------------------------------
+                        if mode_class == "register":
+                            # 신규 등록
                         
-                        if st.form_submit_button("등록하기", type="primary", use_container_width=True):
-                            if not sel_edu_cat or sel_edu_cat == "(없음)":
-                                st.toast("교육구분을 선택해야 합니다.", icon="⚠️")
-                            elif not input_class_name:
-                                st.toast("수업명을 입력해주세요.", icon="⚠️")
-                            else:
-                                new_class_id = f"C{int(time.time())}"
-                                ws_c.append_row([new_class_id, input_class_name, sel_biz_cat, sel_edu_cat, input_instructor, input_start_date])
-                                st.toast(f"수업 '{input_class_name}' 등록 완료!", icon="✅")
-                                time.sleep(1)
-                                st.rerun()
-                    else:
-                        # 수정/삭제
-                        b1, b2 = st.columns(2)
-                        with b1:
-                            is_update = st.form_submit_button("수정하기", type="primary", use_container_width=True)
-                        with b2:
-                            is_delete = st.form_submit_button("삭제하기", type="primary", use_container_width=True)
-
-                        if is_update:
-                            if not sel_edu_cat or not input_class_name:
-                                st.error("필수 정보를 입력해주세요.")
-                            else:
-                                try:
-                                    cell = ws_c.find(target_class_id)
-                                    row_n = cell.row
-                                    ws_c.update(f"A{row_n}:F{row_n}", [[target_class_id, input_class_name, sel_biz_cat, sel_edu_cat, input_instructor, input_start_date]])
-                                    st.toast("수업 정보 수정 완료!", icon="✅")
-                                    time.sleep(1)
+                            if st.form_submit_button("등록하기", type="primary", use_container_width=True):
+                                if not sel_edu_cat or sel_edu_cat == "(없음)":
+                                    st.toast("교육구분을 선택해야 합니다.", icon="⚠️")
+                                elif not input_class_name:
+                                    st.toast("수업명을 입력해주세요.", icon="⚠️")
+                                else:
+                                    new_class_id = new_id("C")
+                                    class_row = [new_class_id, input_class_name, sel_biz_cat, sel_edu_cat, input_instructor, input_start_date]
+                                    ws_c.append_row(class_row)
+                                    table_append(sheet_cls, [class_row])
+                                    st.session_state["success_msg"] = f"수업 '{input_class_name}' 등록 완료!"
                                     st.rerun()
-                                except Exception as e:
-                                    st.error(f"수정 오류: {e}")
+                        else:
+                            # 수정/삭제
+                            b1, b2 = st.columns(2)
+                            with b1:
+                                is_update = st.form_submit_button("수정하기", type="primary", use_container_width=True)
+                            with b2:
+                                is_delete = st.form_submit_button("삭제하기", type="primary", use_container_width=True)
+
+                            if is_update:
+                                if not sel_edu_cat or not input_class_name:
+                                    st.error("필수 정보를 입력해주세요.")
+                                else:
+                                    try:
+                                        row_n = find_row(ws_c, sheet_cls, target_class_id)
+                                        class_row = [target_class_id, input_class_name, sel_biz_cat, sel_edu_cat, input_instructor, input_start_date]
+                                        ws_c.update(f"A{row_n}:F{row_n}", [class_row])
+                                        table_update(sheet_cls, target_class_id, class_row)
+                                        st.session_state["success_msg"] = "수업 정보 수정 완료!"
+                                        st.rerun()
+                                    except Exception as e:
+                                        st.error(f"수정 오류: {e}")
                         
-                        if is_delete:
-                            confirm_delete_class(target_class_id, input_class_name)
+                            if is_delete:
+                                confirm_delete_class(target_class_id, input_class_name)
             
             # 1-5. 수업 목록 표
             st.caption("👇 아래 목록에서 행을 클릭하면 위쪽 입력창에서 수정하거나 삭제할 수 있습니다.")
@@ -2858,11 +4633,11 @@ def main():
                                 if is_exist:
                                     st.error("이미 등록된 교육구분입니다.")
                                 else:
-                                    new_cat_id = f"E{int(time.time())}"
-                                    ws_edu.append_row([new_cat_id, e_biz, e_name, e_type, e_goal_num, e_goal_mem])
-                                    st.success(f"교육구분 '{e_name}' 등록 완료!")
-                                    st.cache_data.clear()
-                                    time.sleep(1)
+                                    new_cat_id = new_id("E")
+                                    cat_row = [new_cat_id, e_biz, e_name, e_type, e_goal_num, e_goal_mem]
+                                    ws_edu.append_row(cat_row)
+                                    table_append("education_categories", [cat_row])
+                                    st.session_state["success_msg"] = f"교육구분 '{e_name}' 등록 완료!"
                                     st.rerun()
                             else:
                                 st.error("교육구분명을 입력하세요.")
@@ -2877,13 +4652,12 @@ def main():
                                 st.error("교육구분명을 입력하세요.")
                             else:
                                 try:
-                                    cell = ws_edu.find(target_cat_id)
-                                    row_n = cell.row
+                                    row_n = find_row(ws_edu, "education_categories", target_cat_id)
                                     # A~F열 업데이트 (ID, 사업구분, 교육구분명, 유형, 목표연인원, 목표실인원)
-                                    ws_edu.update(f"A{row_n}:F{row_n}", [[target_cat_id, e_biz, e_name, e_type, e_goal_num, e_goal_mem]])
-                                    st.toast("교육구분 수정 완료!", icon="✅")
-                                    st.cache_data.clear()
-                                    time.sleep(1)
+                                    cat_row = [target_cat_id, e_biz, e_name, e_type, e_goal_num, e_goal_mem]
+                                    ws_edu.update(f"A{row_n}:F{row_n}", [cat_row])
+                                    table_update("education_categories", target_cat_id, cat_row)
+                                    st.session_state["success_msg"] = "교육구분 수정 완료!"
                                     st.rerun()
                                 except Exception as e:
                                     st.error(f"수정 오류: {e}")